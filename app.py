@@ -3,7 +3,6 @@ from flask_cors import CORS
 from dotenv import load_dotenv
 import os
 import numpy as np
-import subprocess
 
 import json
 import openai
@@ -15,14 +14,15 @@ os.environ["HF_HUB_OFFLINE"] = "1"
 
 from utils.audio_to_text import transcribe_audio
 from utils.subtitle_matcher import (
-    load_index_and_mapping,
     find_best_match,
+    find_best_matches,
     SimpleEmbedder,
+    MATCH_TOP_K,
     get_scenes_up_to,  # 🆕 добавено
     get_movie_duration
 )
 from utils.subtitle_summarizer import (
-    summarize_scene,
+    summarize_chunks,
     summarize_until_now, # 🆕 добавено
     extract_character_profiles
 )
@@ -31,10 +31,13 @@ from utils.generate_image import generate_images_from_summaries
 from utils.search_description import find_best_movie
 from utils.actor_lookup import get_actor_name
 from utils.genre_lookup import get_movie_genre
+from utils.index_store import SubtitleIndexStore
+from utils.movie_catalog import summary_key
+from utils.sync_jobs import SyncJobRunner
 
 
 # 🟦 Регистър за отменени заявки
-cancelled_requests = set()
+from utils.cancellation import cancelled_requests
 
 load_dotenv()
 openai_api_key = os.getenv("OPENAI_API_KEY")
@@ -43,8 +46,11 @@ SECRET_TOKEN = os.getenv("FIREBASE_SYNC_SECRET")
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-INDEX_PATH = "embeddings/subtitle_index.faiss"
-MAPPING_PATH = "embeddings/subtitle_mapping.pkl"
+MATCH_BATCH_LIMIT = int(os.getenv("MATCH_BATCH_LIMIT", "200"))
+MATCH_TOP_K_MAX = int(os.getenv("MATCH_TOP_K_MAX", "200"))  # горна граница на top_k в /match_batch
+
+# 🧠 Индексът (според EMBEDDING_BACKEND) се държи в паметта и се презарежда само при нова версия
+subtitle_index = SubtitleIndexStore()
 
 from utils.subtitle_summarizer import CancelledEarlyException  # Заменѝ с истинския модул
 
@@ -61,12 +67,14 @@ def summarize():
         request_id = None
 
         language = "en"
+        movies = None  # 🎬 по желание: търсене само в известен филм / списък от филми
 
         if request.is_json:
             data = request.get_json()
             input_text = data.get("text")
             request_id = data.get("request_id", str(uuid.uuid4()))
             language = data.get("language", "en")  # 🟢 ново
+            movies = data.get("movies") or data.get("movie")
         elif "audio" in request.files:
             audio_file = request.files["audio"]
             audio_path = "temp_audio.wav"
@@ -76,6 +84,7 @@ def summarize():
             print("📝 Извлечен текст:", input_text)
             request_id = request.form.get("request_id", str(uuid.uuid4()))
             language = request.form.get("language", "en")  # 🟢 ново
+            movies = request.form.getlist("movies") or request.form.get("movie")
         else:
             request_id = str(uuid.uuid4())
 
@@ -83,12 +92,17 @@ def summarize():
         if not input_text:
             return jsonify({"error": "No input text provided"}), 400
 
-        # ✅ Зареждане на индекса и embedding-а
-        index, mapping = load_index_and_mapping(INDEX_PATH, MAPPING_PATH)
+        # ✅ Индексът е вече в паметта (презарежда се само ако файловете са сменени)
+        loaded = subtitle_index.get()
+        index, mapping = loaded.index, loaded.mapping
         embedder = SimpleEmbedder()
 
-        # 🔍 Най-добро съвпадение
-        matches = find_best_match(input_text, index, mapping, embedder)
+        # 🔍 Най-добро съвпадение – top-k кандидата с гласуване по филм и съседни сцени
+        matches = find_best_match(
+            input_text, index, mapping, embedder, top_k=MATCH_TOP_K, aggregate=True,
+            movies=movies, movie_indexes=loaded.movie_indexes, lexical=loaded.lexical,
+            catalog=loaded.catalog
+        )
         if not matches:
             return jsonify({"error": "No match found"}), 404
 
@@ -97,38 +111,34 @@ def summarize():
         timestamp = best["timestamp"]
 
         genre = get_movie_genre(movie)
-        duration = get_movie_duration(movie, mapping)
+        duration = get_movie_duration(movie, mapping, loaded.timelines, loaded.catalog)
 
         try:
-            scenes_until_now = get_scenes_up_to(timestamp, movie, mapping)
+            scenes_until_now = get_scenes_up_to(timestamp, movie, mapping, loaded.timelines)
             print(f"[DEBUG] Извлечени {len(scenes_until_now)} сцени до момента за филм {movie}")
             for i, scene in enumerate(scenes_until_now):
                 print(f"▶️ Сцена {i + 1}:\n{scene[:200]}...\n")
 
+            # 📚 С hash-а на файла и сегментацията от каталога обобщенията се кешират между заявките
+            file_hash = summary_key(loaded.catalog.get(movie))
+
             summary = summarize_until_now(
-                scenes_until_now, movie_name=movie, request_id=request_id, language=language
+                scenes_until_now, movie_name=movie, request_id=request_id, language=language,
+                file_hash=file_hash
             )
             character_profiles = extract_character_profiles(
-                summary, movie_name=movie, request_id=request_id, language=language
+                summary, movie_name=movie, request_id=request_id, language=language,
+                file_hash=file_hash, scene_count=len(scenes_until_now)
             )
 
-            scene_chunks = [
-                "\n".join(scenes_until_now[i:i + 5])
-                for i in range(0, len(scenes_until_now), 5)
-            ]
-            print(f"[DEBUG] Създадени {len(scene_chunks)} чънка")
+            # 🧵 Чънковете по 5 сцени се обобщават паралелно (SUMMARY_WORKERS), редът им се запазва
+            chunk_summaries = summarize_chunks(
+                scenes_until_now, movie_name=movie, request_id=request_id, language=language,
+                file_hash=file_hash
+            )
 
-            chunk_summaries = []
-            for i, chunk in enumerate(scene_chunks):
-                try:
-                    chunk_summary = summarize_scene(
-                        chunk, movie_name=movie, request_id=request_id, language=language
-                    )
-                    print(f"[CHUNK {i + 1}] Обобщение: {chunk_summary}")
-                    chunk_summaries.append(chunk_summary)
-                except Exception as e:
-                    print(f"[ERROR] Чънк {i + 1}: {e}")
-                    chunk_summaries.append("⚠️ Неуспешно обобщение.")
+        except CancelledEarlyException:
+            raise  # → 204 по-долу
 
         except Exception as e:
             import traceback
@@ -151,6 +161,7 @@ def summarize():
             "movie": movie,
             "genre": genre,
             "timestamp": timestamp,
+            "confidence": best.get("confidence"),
             "duration": duration,
             "summary_until_now": summary,
             "character_profiles": character_profiles,
@@ -175,6 +186,91 @@ def summarize():
         return jsonify({"error": str(e)}), 500
 
 
+def _bool_param(data, name, default):
+    # JSON bool или низовете "true"/"false" – bool("false") би бил True
+    value = data.get(name, default)
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    raise ValueError(f"'{name}' must be true or false")
+
+
+def _int_param(data, name, default, low, high=None):
+    # Цяло число (или низ с цяло число), ограничено до [low, high]
+    value = data.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"'{name}' must be an integer")
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an integer")
+    value = max(low, value)
+    return min(value, high) if high is not None else value
+
+
+@app.route("/match_batch", methods=["POST"])
+def match_batch():
+    """
+    Приема JSON {"texts": [...]} и връща съвпаденията за всеки текст,
+    без обобщаване. Всички текстове се търсят с една embedding заявка и едно търсене.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No input data"}), 400
+
+        texts = data.get("texts", [])
+        if not isinstance(texts, list) or not texts:
+            return jsonify({"error": "No texts provided"}), 400
+        if len(texts) > MATCH_BATCH_LIMIT:
+            return jsonify({"error": f"Too many texts (max {MATCH_BATCH_LIMIT})"}), 400
+        if not all(isinstance(t, str) and t.strip() for t in texts):
+            return jsonify({"error": "All texts must be non-empty strings"}), 400
+
+        try:
+            aggregate = _bool_param(data, "aggregate", True)
+            top_k = _int_param(data, "top_k", MATCH_TOP_K if aggregate else 1, 1, MATCH_TOP_K_MAX)
+            max_matches = _int_param(data, "max_matches", 3, 1)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        loaded = subtitle_index.get()
+        embedder = SimpleEmbedder()
+        all_matches = find_best_matches(
+            texts, loaded.index, loaded.mapping, embedder, top_k=top_k, aggregate=aggregate,
+            movies=data.get("movies") or data.get("movie"), movie_indexes=loaded.movie_indexes,
+            lexical=loaded.lexical, catalog=loaded.catalog
+        )
+
+        return jsonify({
+            "results": [
+                {"text": text, "matches": matches[:max_matches]}
+                for text, matches in zip(texts, all_matches)
+            ]
+        })
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/movies", methods=["GET"])
+def list_movies():
+    # 🎬 Каталогът на индексираните филми (или един филм с ?movie=...)
+    try:
+        catalog = subtitle_index.get().catalog
+        name = request.args.get("movie")
+        if name:
+            movie = catalog.resolve(name)
+            if movie is None:
+                return jsonify({"error": f"Unknown movie: {name}"}), 404
+            return jsonify(catalog.get(movie))
+        return jsonify({"movies": list(catalog)})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/generate", methods=["POST"])
 def generate_images():
     """
@@ -279,51 +375,45 @@ def search_description():
 
 
 
-@app.route('/sync', methods=['POST'])
-def trigger_indexing():
-    try:
-        print("📥 Получена заявка за /sync от Firebase Function.")
-        print("🚀 Започва синхронизация и индексиране...")
-
-        # 🧠 Стартиране на index скрипта
-        index_result = subprocess.run(
-            ["python", "generate_index.py"],
-            capture_output=True,
-            text=True
-        )
+def _after_sync_stage(stage):
+    # 🔁 Новата версия на индекса се зарежда веднага, без да чакаме описанията
+    if stage == "subtitles":
+        subtitle_index.reload()
 
-        if index_result.returncode != 0:
-            print("❌ Скриптът generate_index.py се провали:")
-            print(index_result.stderr)
-            return jsonify({"status": "error", "message": index_result.stderr}), 500
 
-        print("✅ Индексиране на сцени завършено.")
-        print("🧠 Започва генериране на описания...")
+# 🔄 /sync само поставя задача в опашката – индексирането върви във фонова нишка
+sync_jobs = SyncJobRunner(on_stage_success=_after_sync_stage)
 
-        # 🎬 Стартиране на описанията
-        desc_result = subprocess.run(
-            ["python", "generate_description_embeddings.py"],
-            capture_output=True,
-            text=True
-        )
 
-        if desc_result.returncode != 0:
-            print("❌ Скриптът generate_description_embeddings.py се провали:")
-            print(desc_result.stderr)
-            return jsonify({"status": "error", "message": desc_result.stderr}), 500
+@app.route('/sync', methods=['POST'])
+def trigger_indexing():
+    try:
+        print("📥 Получена заявка за /sync от Firebase Function.")
+        job, coalesced = sync_jobs.submit()
+        if coalesced:
+            print(f"🔗 Заявката е слята с чакащата задача {job.id}.")
+        else:
+            print(f"🚀 Създадена задача за синхронизация и индексиране: {job.id}")
 
-        print("✅ Описанията са генерирани успешно.")
         return jsonify({
-            "status": "success",
-            "index_output": index_result.stdout,
-            "desc_output": desc_result.stdout
-        }), 200
+            "status": job.status,
+            "job_id": job.id,
+            "coalesced": coalesced
+        }), 202
 
     except Exception as e:
         print("❌ Грешка при изпълнение на /sync:", e)
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@app.route('/sync/<job_id>', methods=['GET'])
+def sync_status(job_id):
+    job = sync_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    return jsonify(job), 200
+
+
 
 
 SONG_DB_PATH = "soundtracks.json"
@@ -0,0 +1,105 @@
+import os
+import time
+import argparse
+import faiss
+import numpy as np
+
+from utils.index_factory import INDEX_TYPES, build_index, configure_search, reconstruct_all
+from utils.index_paths import index_path
+
+# 📊 Сравнение на видовете индекси върху реалните embedding-и от embeddings/
+# recall@k спрямо точното (flat) търсене + p50/p99 латентност на единична заявка
+INDEX_PATH = index_path()
+
+
+def make_queries(vectors, count, noise, seed):
+    # Заявките са случайни сцени с малко шум – като потребител, който перифразира реплика
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)
+    queries = vectors[picked].copy()
+    if noise > 0:
+        queries += rng.normal(0, noise, queries.shape).astype("float32")
+    return np.ascontiguousarray(queries, dtype="float32")
+
+
+def recall_at_k(found, truth, k):
+    hits = 0
+    for found_row, truth_row in zip(found[:, :k], truth[:, :k]):
+        hits += len(set(found_row.tolist()) & set(truth_row.tolist()))
+    return hits / (len(truth) * k)
+
+
+def time_single_queries(index, queries, k):
+    # Сървърът търси по една заявка, затова мерим всяка поотделно
+    latencies = []
+    results = np.empty((len(queries), k), dtype="int64")
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, ids = index.search(queries[i:i + 1], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results[i] = ids[0]
+    return results, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def index_size_mb(index):
+    return faiss.serialize_index(index).nbytes / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall/latency benchmark за FAISS индекса на субтитрите")
+    parser.add_argument("--index", default=INDEX_PATH)
+    parser.add_argument("--types", default=",".join(INDEX_TYPES))
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.01)
+    parser.add_argument("--nprobe", default="1,4,16,64")
+    parser.add_argument("--ef-search", default="16,64,256")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.index):
+        raise FileNotFoundError(f"❌ FAISS индексът не съществува: {args.index}")
+
+    vectors = np.ascontiguousarray(reconstruct_all(faiss.read_index(args.index)), dtype="float32")
+    queries = make_queries(vectors, args.queries, args.noise, args.seed)
+    k = args.k
+    print(f"📦 {len(vectors)} вектора × {vectors.shape[1]} измерения, {len(queries)} заявки, k={k}\n")
+
+    flat = build_index(vectors, "flat")
+    _, truth = flat.search(queries, k)
+
+    print(f"{'индекс':<12} {'параметър':<14} {'build s':>8} {'MB':>8} {'recall@1':>9} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for index_type in args.types.split(","):
+        start = time.perf_counter()
+        try:
+            index = build_index(vectors, index_type)
+        except ValueError as e:
+            print(f"{index_type:<12} ⚠️ {e}")
+            continue
+        build_seconds = time.perf_counter() - start
+        size = index_size_mb(index)
+
+        if index_type in ("ivf_flat", "ivf_pq"):
+            settings = [("nprobe", int(v)) for v in args.nprobe.split(",")]
+        elif index_type == "hnsw":
+            settings = [("efSearch", int(v)) for v in args.ef_search.split(",")]
+        else:
+            settings = [("-", None)]
+
+        for name, value in settings:
+            if name == "nprobe":
+                configure_search(index, nprobe=value)
+            elif name == "efSearch":
+                configure_search(index, ef_search=value)
+
+            found, p50, p99 = time_single_queries(index, queries, k)
+            label = f"{name}={value}" if value is not None else "-"
+            print(
+                f"{index_type:<12} {label:<14} {build_seconds:>8.2f} {size:>8.1f} "
+                f"{recall_at_k(found, truth, 1):>9.3f} {recall_at_k(found, truth, k):>9.3f} "
+                f"{p50:>8.3f} {p99:>8.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+from utils.embedding_backends import get_backend
+from utils.embedding_pipeline import embed_texts
+from utils.index_factory import build_index
+from utils.segmentation import segmentation_config
+from utils.subtitle_parser import iter_cues, parse_directory
+
+# 📊 Сравнение на стратегиите за сегментация (utils/segmentation.py) върху субтитрите в subtitles/:
+# вектори на филм, цена на изграждането (парсване, embedding, индекс) и hit rate върху цитати.
+# Цитатите са от --quotes ([{"movie", "text", "start_ms"}]) или случайни реплики от файловете.
+SUBTITLES_FOLDER = "subtitles"
+
+DEFAULT_PRESETS = [
+    ("cues-1", "cues", {"max_cues": 1}),
+    ("cues-5", "cues", {"max_cues": 5}),
+    ("cues-10", "cues", {"max_cues": 10}),
+    ("time-20s", "time", {"window_ms": 20000}),
+    ("time-60s", "time", {"window_ms": 60000}),
+    ("gap-2.5s", "gap", {"gap_ms": 2500, "max_cues": 12}),
+    ("sliding-5/2", "sliding", {"max_cues": 5, "overlap": 2}),
+]
+
+
+def parse_preset(value):
+    # "име=стратегия:ключ=стойност,ключ=стойност" → (име, стратегия, параметри)
+    name, _, spec = value.partition("=")
+    strategy, _, params = (spec or name).partition(":")
+    parsed = {}
+    for pair in filter(None, params.split(",")):
+        key, _, number = pair.partition("=")
+        parsed[key] = int(number)
+    return name, strategy, parsed
+
+
+def load_quotes(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def sample_quotes(folder, count, seed, min_chars=25):
+    # По няколко реплики от всеки филм – достатъчно дълги, за да са разпознаваеми
+    rng = np.random.default_rng(seed)
+    filenames = sorted(name for name in os.listdir(folder) if name.endswith(".srt"))
+    per_movie = max(1, -(-count // max(1, len(filenames))))
+    quotes = []
+    for filename in filenames:
+        movie = filename.replace(".srt", "")
+        cues = [cue for cue in iter_cues(os.path.join(folder, filename)) if len(cue["text"]) >= min_chars]
+        if not cues:
+            continue
+        for pos in rng.choice(len(cues), size=min(per_movie, len(cues)), replace=False):
+            cue = cues[pos]
+            quotes.append({"movie": movie, "text": cue["text"], "start_ms": cue["start_ms"]})
+    return quotes[:count]
+
+
+def evaluate(index, scenes, query_vectors, quotes, k):
+    # hit@1 – първият резултат е от правилния филм; scene@k – някоя от първите k сцени съдържа цитата
+    _, found = index.search(query_vectors, k)
+    movie_hits = scene_hits = 0
+    for quote, row in zip(quotes, found):
+        hits = [scenes[pos] for pos in row if pos >= 0]
+        if hits and hits[0]["movie"] == quote["movie"]:
+            movie_hits += 1
+        if any(
+            scene["movie"] == quote["movie"] and scene["start_ms"] <= quote["start_ms"] <= scene["end_ms"]
+            for scene in hits
+        ):
+            scene_hits += 1
+    return movie_hits / len(quotes), scene_hits / len(quotes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Размер на индекса/hit rate за стратегиите за сегментация")
+    parser.add_argument("--subtitles", default=SUBTITLES_FOLDER)
+    parser.add_argument("--presets", action="append",
+                        help="име=стратегия:ключ=стойност,... (може много пъти); по подразбиране – вградените")
+    parser.add_argument("--quotes", help="JSON с цитати [{\"movie\", \"text\", \"start_ms\"}]")
+    parser.add_argument("--sample", type=int, default=200, help="брой случайни цитати без --quotes")
+    parser.add_argument("--backend", default=None, help="openai | local (по подразбиране EMBEDDING_BACKEND)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.subtitles):
+        raise FileNotFoundError(f"❌ Папката със субтитри не съществува: {args.subtitles}")
+
+    presets = [parse_preset(value) for value in args.presets] if args.presets else DEFAULT_PRESETS
+    backend = get_backend(args.backend)
+    quotes = load_quotes(args.quotes) if args.quotes else sample_quotes(args.subtitles, args.sample, args.seed)
+    if not quotes:
+        raise ValueError("❌ Няма цитати за оценка.")
+
+    # Цитатите се embed-ват веднъж – еднакви са за всички стратегии
+    query_vectors = np.ascontiguousarray(
+        [backend.embed_query(quote["text"]) for quote in quotes], dtype="float32"
+    )
+    print(f"🎬 Бекенд {backend.name} ({backend.model_name}), {len(quotes)} цитата, k={args.k}\n")
+
+    print(
+        f"{'стратегия':<14} {'вектори':>8} {'на филм':>16} {'символи':>10} "
+        f"{'parse s':>8} {'embed s':>8} {'index s':>8} {'hit@1':>7} {'scene@k':>8}"
+    )
+    for name, strategy, params in presets:
+        config = segmentation_config(strategy, **params)
+
+        start = time.perf_counter()
+        parsed = parse_directory(args.subtitles, config)
+        parse_seconds = time.perf_counter() - start
+
+        scenes = [
+            {**scene, "movie": filename.replace(".srt", "")}
+            for filename, file_scenes in parsed.items() for scene in file_scenes
+        ]
+        per_movie = [len(file_scenes) for file_scenes in parsed.values()] or [0]
+        chars = sum(len(scene["text"]) for scene in scenes)
+
+        # Склад с embedding-и (EMBEDDING_STORE_DIR) – повторно пускане не плаща отново за същите сцени
+        start = time.perf_counter()
+        vectors = embed_texts(backend, [scene["text"] for scene in scenes])
+        embed_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = build_index(vectors, "flat")
+        index_seconds = time.perf_counter() - start
+
+        hit_at_1, scene_at_k = evaluate(index, scenes, query_vectors, quotes, args.k)
+        spread = f"{np.mean(per_movie):.0f} ({min(per_movie)}–{max(per_movie)})"
+        print(
+            f"{name:<14} {len(scenes):>8} {spread:>16} {chars:>10} "
+            f"{parse_seconds:>8.2f} {embed_seconds:>8.2f} {index_seconds:>8.2f} "
+            f"{hit_at_1:>7.3f} {scene_at_k:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import os
+import time
+import argparse
+
+import tiktoken
+
+from utils.subtitle_parser import parse_segments
+from utils.subtitle_summarizer import LANGUAGE_MAP, build_scene_prompt, count_tokens, get_encoding
+
+# 📊 CPU време за броене на токени в последователния режим на summarize_until_now (без LLM):
+#   преди – encoding_for_model при всяко броене и целият контекст се токенизира наново за всяка сцена
+#   сега  – encoding-ът е кеширан, а контекстът се брои веднъж, с нарастващ брояч
+# Обобщенията на сцените се имитират с първите --summary-words думи от сцената.
+SUBTITLES_FOLDER = "subtitles"
+MODEL = "gpt-3.5-turbo"
+
+
+def old_count_tokens(text, model=MODEL):
+    encoding = tiktoken.encoding_for_model(model)
+    return len(encoding.encode(text))
+
+
+def fake_summary(scene, words):
+    return " ".join(scene.split()[:words])
+
+
+def accounting_before(scenes, summaries, movie, language_name, max_tokens):
+    context_so_far = ""
+    intro_tokens = old_count_tokens(f'Филмът "{movie}" започва със сцената...\n\n')
+    for i, scene in enumerate(scenes):
+        prompt = build_scene_prompt(i + 1, movie, language_name, context_so_far, scene)
+        if old_count_tokens(prompt) + old_count_tokens(context_so_far) + intro_tokens > max_tokens:
+            return i
+        context_so_far += "\n" + summaries[i]
+    return len(scenes)
+
+
+def accounting_after(scenes, summaries, movie, language_name, max_tokens):
+    context_tokens = 0
+    intro_tokens = count_tokens(f'Филмът "{movie}" започва със сцената...\n\n', model=MODEL)
+    for i, scene in enumerate(scenes):
+        prompt_tokens = count_tokens(build_scene_prompt(i + 1, movie, language_name, "", scene), model=MODEL)
+        if prompt_tokens + 2 * context_tokens + intro_tokens > max_tokens:
+            return i
+        context_tokens += count_tokens("\n" + summaries[i], model=MODEL)
+    return len(scenes)
+
+
+def cpu_ms(fn, *args, repeat=1):
+    start = time.process_time()
+    for _ in range(repeat):
+        result = fn(*args)
+    return (time.process_time() - start) * 1000 / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU време за токенизация на едно /summarize – преди и сега")
+    parser.add_argument("--subtitles", default=SUBTITLES_FOLDER)
+    parser.add_argument("--movies", default="", help="файлове без .srt, разделени със запетая (по подразбиране – всички)")
+    parser.add_argument("--max-tokens", type=int, default=15000)
+    parser.add_argument("--summary-words", type=int, default=80)
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    movies = [name.strip() for name in args.movies.split(",") if name.strip()] or sorted(
+        name[:-4] for name in os.listdir(args.subtitles) if name.endswith(".srt")
+    )
+    language_name = LANGUAGE_MAP.get(args.language, "English")
+    get_encoding(MODEL)  # зареждането на BPE таблицата не се брои и в двата случая
+    old_count_tokens("")
+
+    print(f"{'филм':<40} {'сцени':>6} {'спира на':>9} {'преди ms':>10} {'сега ms':>9} {'×':>6}")
+    total_before = total_after = 0.0
+    for movie in movies:
+        scenes = [scene["text"] for scene in parse_segments(os.path.join(args.subtitles, movie + ".srt"))]
+        summaries = [fake_summary(scene, args.summary_words) for scene in scenes]
+
+        before_ms, stop_before = cpu_ms(accounting_before, scenes, summaries, movie, language_name,
+                                        args.max_tokens, repeat=args.repeat)
+        after_ms, stop_after = cpu_ms(accounting_after, scenes, summaries, movie, language_name,
+                                      args.max_tokens, repeat=args.repeat)
+        total_before += before_ms
+        total_after += after_ms
+        # Сборът на частите може да се различава с няколко токена от целия текст (BPE на границите)
+        stop = str(stop_after) if stop_before == stop_after else f"{stop_before}/{stop_after}"
+        print(f"{movie[:40]:<40} {len(scenes):>6} {stop:>9} {before_ms:>10.1f} {after_ms:>9.1f} "
+              f"{before_ms / max(after_ms, 1e-9):>6.1f}")
+
+    print(f"\n⏱️ Общо: преди {total_before:.0f} ms, сега {total_after:.0f} ms CPU за токенизация "
+          f"({total_before / max(total_after, 1e-9):.1f}×)")
+
+
+if __name__ == "__main__":
+    main()
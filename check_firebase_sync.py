@@ -0,0 +1,112 @@
+import os
+import base64
+import hashlib
+import tempfile
+
+from firebase_utils import (
+    FIREBASE_SUBTITLE_PREFIX, sync_subtitles_from_firebase, load_sync_state, current_sync_seq,
+    unchanged_synced_files,
+)
+
+# 🧪 Проверка на Firebase sync-а срещу fake bucket в паметта – без credentials и мрежа:
+# нови, променени и изтрити файлове, MD5, който не съвпада, и дневника за generate_index.py.
+#   python check_firebase_sync.py
+
+
+def md5_base64(data):
+    return base64.b64encode(hashlib.md5(data).digest()).decode("ascii")
+
+
+class FakeBlob:
+    def __init__(self, name, data, generation, corrupt=False):
+        self.name = name
+        self.data = data
+        self.generation = generation
+        self.md5_hash = md5_base64(data)
+        self.corrupt = corrupt  # сваля се друго съдържание от обявеното в md5_hash
+
+    def download_to_filename(self, path):
+        with open(path, "wb") as f:
+            f.write(self.data + b"!" if self.corrupt else self.data)
+
+
+class FakeBucket:
+    name = "fake-bucket"
+
+    def __init__(self):
+        self.blobs = {}
+        self._generation = 0
+
+    def upload(self, filename, data, corrupt=False):
+        self._generation += 1
+        name = FIREBASE_SUBTITLE_PREFIX + filename
+        self.blobs[name] = FakeBlob(name, data, self._generation, corrupt)
+
+    def delete(self, filename):
+        del self.blobs[FIREBASE_SUBTITLE_PREFIX + filename]
+
+    def list_blobs(self, prefix=""):
+        return [blob for name, blob in sorted(self.blobs.items()) if name.startswith(prefix)]
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(f"❌ {message}")
+    print(f"✅ {message}")
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as root:
+        local_dir = os.path.join(root, "subtitles")
+        state_path = os.path.join(local_dir, ".firebase_sync.json")
+        changes_path = os.path.join(local_dir, ".firebase_changes.json")
+
+        def sync(bucket):
+            return sync_subtitles_from_firebase(bucket, local_dir, state_path, workers=2,
+                                                changes_path=changes_path)
+
+        bucket = FakeBucket()
+        bucket.upload("A.srt", b"1\n00:00:01,000 --> 00:00:02,000\nHello\n")
+        bucket.upload("B.srt", b"1\n00:00:01,000 --> 00:00:02,000\nWorld\n")
+        bucket.upload("notes.txt", b"not a subtitle")
+
+        changes = sync(bucket)
+        check(changes == {"added": ["A.srt", "B.srt"], "changed": [], "removed": []}, "нови файлове се свалят")
+        check(sorted(os.listdir(local_dir)) == [".firebase_changes.json", ".firebase_sync.json", "A.srt", "B.srt"],
+              "само .srt файловете са на диска")
+        indexed_seq = current_sync_seq(changes_path)
+
+        changes = sync(bucket)
+        check(not any(changes.values()), "повторен sync без промени не сваля нищо")
+
+        bucket.upload("B.srt", b"1\n00:00:01,000 --> 00:00:02,000\nWorld!\n")
+        bucket.delete("A.srt")
+        changes = sync(bucket)
+        check(changes == {"added": [], "changed": ["B.srt"], "removed": ["A.srt"]}, "промени и изтривания се откриват")
+        check(read(os.path.join(local_dir, "B.srt")).endswith(b"World!\n"), "промененият файл е свален наново")
+        check(not os.path.exists(os.path.join(local_dir, "A.srt")), "изтритият от bucket-а файл е изтрит локално")
+
+        bucket.upload("C.srt", b"1\n00:00:01,000 --> 00:00:02,000\nBroken\n", corrupt=True)
+        try:
+            sync(bucket)
+            failed = False
+        except RuntimeError:
+            failed = True
+        check(failed, "MD5, който не съвпада, проваля sync-а")
+        check(not os.path.exists(os.path.join(local_dir, "C.srt")), "файл с грешен MD5 не остава на диска")
+        check("C.srt" not in load_sync_state(state_path), "файл с грешен MD5 се опитва пак при следващия sync")
+
+        unchanged = unchanged_synced_files(indexed_seq, state_path, changes_path)
+        check(unchanged == set(), "файловете, пипнати след индексирането, се hash-ват наново")
+        unchanged = unchanged_synced_files(current_sync_seq(changes_path), state_path, changes_path)
+        check(unchanged == {"B.srt"}, "след индексиране непроменените файлове не се hash-ват")
+        check(unchanged_synced_files(None, state_path, changes_path) == set(), "без номер от манифеста се hash-ва всичко")
+
+
+if __name__ == "__main__":
+    main()
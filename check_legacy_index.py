@@ -0,0 +1,65 @@
+import os
+import pickle
+import tempfile
+
+import faiss
+import numpy as np
+
+from utils.index_store import SubtitleIndexStore
+from utils.index_paths import index_dir, index_path, mapping_path, legacy_mapping_path
+from utils.scene_store import write_scene_store
+
+# 🧪 Проверка, че сървърът тръгва върху стар деплой – само subtitle_index.faiss и
+# subtitle_mapping.pkl в embeddings/, без CURRENT и без subtitle_scenes/:
+#   python check_legacy_index.py
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(f"❌ {message}")
+    print(f"✅ {message}")
+
+
+def legacy_mapping():
+    mapping = {}
+    for movie in ("Alpha", "Beta"):
+        for line in range(3):
+            mapping[len(mapping)] = {
+                "lines": f"{movie} line {line}",
+                "timestamp": f"00:00:{line * 10:02d},000",
+                "movie": movie,
+            }
+    return mapping
+
+
+def main():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as root:
+        os.chdir(root)
+        try:
+            os.makedirs(index_dir("openai"))
+            mapping = legacy_mapping()
+            vectors = np.random.default_rng(0).random((len(mapping), 8), dtype="float32")
+            index = faiss.IndexFlatL2(8)
+            index.add(vectors)
+            faiss.write_index(index, index_path(base=index_dir("openai")))
+            with open(legacy_mapping_path("openai"), "wb") as f:
+                pickle.dump(mapping, f)
+
+            store = SubtitleIndexStore("openai")
+            loaded = store.get()
+            check(loaded.index.ntotal == len(mapping) == len(loaded.mapping), "индекс + стар pickle се зареждат")
+            check(sorted(loaded.timelines) == ["Alpha", "Beta"], "филмите от pickle-а са в timeline-ите")
+            check(store.get() is loaded, "без промяна на файловете не се презарежда")
+
+            # След convert_mapping.py колонният mapping има предимство пред pickle-а
+            write_scene_store(mapping_path(base=index_dir("openai")), mapping)
+            converted = store.get()
+            check(converted is not loaded and len(converted.mapping) == len(mapping),
+                  "след конвертиране се зарежда subtitle_scenes/")
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
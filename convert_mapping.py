@@ -0,0 +1,42 @@
+import os
+import sys
+import pickle
+from utils.scene_store import SceneStore, write_scene_store, timestamp_to_ms
+
+# Еднократно преобразуване на стария subtitle_mapping.pkl в колонния формат
+LEGACY_MAPPING_PATH = "embeddings/subtitle_mapping.pkl"
+MAPPING_PATH = "embeddings/subtitle_scenes"
+
+
+def convert(src=LEGACY_MAPPING_PATH, dst=MAPPING_PATH):
+    if not os.path.exists(src):
+        raise FileNotFoundError(f"❌ Pickle mapping файлът не съществува: {src}")
+
+    with open(src, "rb") as f:
+        mapping = pickle.load(f)
+    print(f"📦 Заредени {len(mapping)} сцени от {src}")
+
+    write_scene_store(dst, mapping)
+    store = SceneStore(dst)
+
+    # ✅ Проверка, че всяка сцена е прехвърлена без загуби
+    mismatches = 0
+    for scene_id, entry in mapping.items():
+        converted = store[scene_id]
+        if (
+            converted["lines"] != entry["lines"]
+            or converted["movie"] != entry["movie"]
+            or timestamp_to_ms(converted["timestamp"]) != timestamp_to_ms(entry["timestamp"])
+        ):
+            mismatches += 1
+
+    if mismatches:
+        print(f"⚠️ {mismatches} сцени се различават след преобразуването!")
+    else:
+        print(f"✅ Записани {len(store)} сцени ({len(store.movies)} филма) в {dst}")
+    return mismatches
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    sys.exit(1 if convert(*args) else 0)
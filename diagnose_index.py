@@ -1,17 +1,20 @@
-import pickle
 import faiss
 import os
 from collections import defaultdict
+from utils.scene_store import SceneStore, load_mapping as load_scene_mapping
+from utils.index_paths import index_path, mapping_path, unversioned_mapping_path, catalog_path, current_version
+from utils.movie_catalog import MovieCatalog
+from utils.index_versions import verify_version
 
-# Пътища към файловете (ако са в папка embeddings)
-INDEX_PATH = "embeddings/subtitle_index.faiss"
-MAPPING_PATH = "embeddings/subtitle_mapping.pkl"
+# Пътища към файловете (според EMBEDDING_BACKEND)
+INDEX_PATH = index_path()
+MAPPING_PATH = mapping_path() if current_version() else unversioned_mapping_path()  # без версии – и стар pickle
+CATALOG_PATH = catalog_path()
 
 def load_mapping(mapping_path):
     if not os.path.exists(mapping_path):
         raise FileNotFoundError(f"❌ Mapping файлът не съществува: {mapping_path}")
-    with open(mapping_path, "rb") as f:
-        return pickle.load(f)
+    return load_scene_mapping(mapping_path)
 
 def load_index(index_path):
     if not os.path.exists(index_path):
@@ -19,6 +22,14 @@ def load_index(index_path):
     return faiss.read_index(index_path)
 
 def diagnose():
+    version = current_version()
+    if version:
+        problems = verify_version(version)
+        status = "✅ контролните суми съвпадат" if not problems else "❌ " + "; ".join(problems)
+        print(f"🗃️ Активна версия: {version} ({status})")
+    else:
+        print("🗃️ Индексът още няма версии (стар формат).")
+
     print("📦 Зареждане на mapping и индекс...")
     mapping = load_mapping(MAPPING_PATH)
     index = load_index(INDEX_PATH)
@@ -28,15 +39,36 @@ def diagnose():
     print(f" - 🗂️ Mapping entries: {len(mapping)}\n")
 
     # Броим сцените по филм
-    movie_counts = defaultdict(int)
-    for entry in mapping.values():
-        movie = entry.get("movie", "❓ unknown")
-        movie_counts[movie] += 1
+    if isinstance(mapping, SceneStore):
+        movie_counts = mapping.movie_counts()
+    else:
+        movie_counts = defaultdict(int)
+        for entry in mapping.values():
+            movie = entry.get("movie", "❓ unknown")
+            movie_counts[movie] += 1
+
+    # 🎬 Каталогът (ако го има) се сравнява с реалния брой сцени в mapping-а
+    catalog = MovieCatalog.load(CATALOG_PATH) if os.path.exists(CATALOG_PATH) else None
+    if catalog is None:
+        print("ℹ️ Няма каталог на филмите – броят се само сцените в mapping-а.")
 
     print("🎬 Сцени по филм:")
     for movie, count in sorted(movie_counts.items(), key=lambda x: -x[1]):
         status = "✅ OK" if count > 0 else "❌ Missing"
-        print(f" - {movie}: {count} сцени ({status})")
+        row = catalog.get(movie) if catalog is not None else None
+        if catalog is not None and row is None:
+            status = "⚠️ липсва в каталога"
+        elif row is not None and row["scene_count"] != count:
+            status = f"⚠️ каталогът казва {row['scene_count']}"
+        details = f", {catalog.duration(movie)}, {row['file']}" if row is not None else ""
+        if row is not None and row.get("aliases"):
+            details += f", псевдоними: {', '.join(row['aliases'])}"
+        print(f" - {movie}: {count} сцени{details} ({status})")
+
+    if catalog is not None:
+        for row in catalog:
+            if row["movie"] not in movie_counts:
+                print(f" - {row['movie']}: 0 сцени (❌ има го в каталога, но не и в mapping-а)")
 
     # Проверка за съответствие index <-> mapping
     if index.ntotal != len(mapping):
@@ -1,6 +1,8 @@
 import os
-import firebase_admin
-from firebase_admin import credentials, storage
+import json
+import base64
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # 🟢 Първо зареди .env файла
@@ -10,43 +12,209 @@ load_dotenv()
 FIREBASE_CREDENTIALS_PATH = os.getenv("FIREBASE_CREDENTIALS_PATH")
 BUCKET_NAME = os.getenv("BUCKET_NAME")
 LOCAL_SUBTITLE_DIR = "subtitles"
+FIREBASE_SUBTITLE_PREFIX = os.getenv("FIREBASE_SUBTITLE_PREFIX", "subtitles/")
+FIREBASE_SYNC_WORKERS = int(os.getenv("FIREBASE_SYNC_WORKERS", "8"))
+# Файл със състоянието на последния sync: {файл: {"blob", "generation", "md5"}}
+FIREBASE_SYNC_STATE = os.getenv("FIREBASE_SYNC_STATE", os.path.join(LOCAL_SUBTITLE_DIR, ".firebase_sync.json"))
+# Изтрит от bucket-а файл се трие и локално (само ако е бил свален от sync-а)
+FIREBASE_SYNC_DELETE = os.getenv("FIREBASE_SYNC_DELETE", "1") == "1"
+# Дневник на промените от всеки sync: {"seq", "trimmed", "entries": [{"seq", "added", "changed", "removed"}]}
+# generate_index.py не смята наново hash-а на свалените файлове, които не са пипани след последното индексиране
+FIREBASE_SYNC_CHANGES = os.getenv("FIREBASE_SYNC_CHANGES", os.path.join(LOCAL_SUBTITLE_DIR, ".firebase_changes.json"))
+FIREBASE_SYNC_CHANGES_KEEP = int(os.getenv("FIREBASE_SYNC_CHANGES_KEEP", "100"))
+
+
+def get_bucket():
+    """
+    🛡️ Firebase се инициализира при първото ползване, а не при import – скриптовете,
+    които не синхронизират (SKIP_FIREBASE_SYNC=1), не се нуждаят от credentials.
+    С STORAGE_EMULATOR_HOST клиентът работи срещу локалния емулатор.
+    """
+    import firebase_admin
+    from firebase_admin import credentials, storage
+
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
+        firebase_admin.initialize_app(cred, {
+            'storageBucket': BUCKET_NAME
+        })
+    return storage.bucket()
 
-# 🛡️ Инициализирай Firebase само ако не е вече
-if not firebase_admin._apps:
-    cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
-    firebase_admin.initialize_app(cred, {
-        'storageBucket': BUCKET_NAME
-    })
 
 # 🔎 Тестване: Изведи списък с blob-ове (само за отстраняване на грешки)
 def test_list_blobs():
-    bucket = storage.bucket()
+    bucket = get_bucket()
     blobs = list(bucket.list_blobs())
     print(f"✅ FOUND {len(blobs)} FILES:")
     for blob in blobs:
         print(blob.name)
 
+
+def file_md5(path):
+    # Във формата на Cloud Storage (base64 на MD5), за да се сравнява директно с blob.md5_hash
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return base64.b64encode(digest.digest()).decode("ascii")
+
+
+def load_sync_state(path=FIREBASE_SYNC_STATE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_sync_state(state, path=FIREBASE_SYNC_STATE):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_sync_changes(path=FIREBASE_SYNC_CHANGES):
+    if not os.path.exists(path):
+        return {"seq": 0, "trimmed": 0, "entries": []}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def record_sync_changes(changes, path=FIREBASE_SYNC_CHANGES, keep=FIREBASE_SYNC_CHANGES_KEEP):
+    # Всеки sync с промени получава пореден номер; най-старите записи над keep се махат
+    log = load_sync_changes(path)
+    if any(changes.values()):
+        log["seq"] += 1
+        log["entries"].append({"seq": log["seq"], **changes})
+        if len(log["entries"]) > keep:
+            dropped = log["entries"][:-keep]
+            log["entries"] = log["entries"][-keep:]
+            log["trimmed"] = dropped[-1]["seq"]
+    save_sync_state(log, path)
+    return log["seq"]
+
+
+def current_sync_seq(path=FIREBASE_SYNC_CHANGES):
+    # None, ако sync-ът още не е водил дневник – тогава нищо не се приема за непроменено
+    return load_sync_changes(path)["seq"] if os.path.exists(path) else None
+
+
+def unchanged_synced_files(since_seq, state_path=FIREBASE_SYNC_STATE, changes_path=FIREBASE_SYNC_CHANGES):
+    """
+    Файловете, свалени от sync-а и непроменени от него след since_seq (номерът, до
+    който е стигнало последното индексиране). Празно множество, ако дневникът не
+    покрива целия период – тогава всички файлове се hash-ват наново.
+    """
+    if since_seq is None or not os.path.exists(changes_path):
+        return set()
+    log = load_sync_changes(changes_path)
+    if since_seq < log["trimmed"] or since_seq > log["seq"]:
+        return set()
+    touched = set()
+    for entry in log["entries"]:
+        if entry["seq"] > since_seq:
+            touched.update(entry["added"], entry["changed"], entry["removed"])
+    return {filename for filename in load_sync_state(state_path) if filename not in touched}
+
+
+def _blob_state(blob):
+    return {"blob": blob.name, "generation": blob.generation, "md5": blob.md5_hash}
+
+
+def _download(blob, local_path):
+    # Във временен файл и после os.replace – индексирането никога не вижда недосвален .srt
+    tmp_path = f"{local_path}.part-{os.getpid()}"
+    try:
+        blob.download_to_filename(tmp_path)
+        if blob.md5_hash and file_md5(tmp_path) != blob.md5_hash:
+            raise IOError(f"MD5 не съвпада за {blob.name}")
+        os.replace(tmp_path, local_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
 # 🔁 Основна функция
-def sync_subtitles_from_firebase():
-    bucket = storage.bucket()
-    blobs = bucket.list_blobs(prefix="subtitles/")
-    os.makedirs(LOCAL_SUBTITLE_DIR, exist_ok=True)
-    print("🔐 FIREBASE_CREDENTIALS_PATH:", FIREBASE_CREDENTIALS_PATH)
+def sync_subtitles_from_firebase(bucket=None, local_dir=LOCAL_SUBTITLE_DIR, state_path=FIREBASE_SYNC_STATE,
+                                 workers=FIREBASE_SYNC_WORKERS, delete_removed=FIREBASE_SYNC_DELETE,
+                                 changes_path=FIREBASE_SYNC_CHANGES):
+    """
+    Сваля само новите и променените .srt файлове (по generation/MD5 на blob-а спрямо
+    състоянието от последния sync), паралелно с най-много workers изтегляния.
+    bucket може да се подаде (тестове, fake bucket) – иначе е Firebase bucket-ът.
+    Връща {"added": [...], "changed": [...], "removed": [...]} с имената на файловете;
+    същото се добавя и в дневника changes_path за generate_index.py.
+    """
+    bucket = bucket if bucket is not None else get_bucket()
+    os.makedirs(local_dir, exist_ok=True)
     print("🪣 BUCKET:", bucket.name)
-    print("📦 STORAGE LIB FROM:", storage.__file__)
 
-    downloaded = []
-
-    for blob in blobs:
+    state = load_sync_state(state_path)
+    remote = {}
+    for blob in bucket.list_blobs(prefix=FIREBASE_SUBTITLE_PREFIX):
         if blob.name.endswith(".srt"):
-            filename = os.path.basename(blob.name)
-            local_path = os.path.join(LOCAL_SUBTITLE_DIR, filename)
-            if not os.path.exists(local_path):
-                blob.download_to_filename(local_path)
-                print(f"⬇️ Свален нов файл: {filename}")
-                downloaded.append(filename)
-
-    if not downloaded:
+            remote[os.path.basename(blob.name)] = blob
+
+    added, changed, downloads = [], [], []
+    for filename, blob in sorted(remote.items()):
+        local_path = os.path.join(local_dir, filename)
+        known = state.get(filename)
+        if known is not None and os.path.exists(local_path):
+            if known["generation"] == blob.generation or (blob.md5_hash and known["md5"] == blob.md5_hash):
+                state[filename] = _blob_state(blob)  # нова generation със същото съдържание
+                continue
+            changed.append(filename)
+        elif os.path.exists(local_path):
+            # Файл отпреди състоянието – ако съдържанието съвпада, само го запомняме
+            if blob.md5_hash and file_md5(local_path) == blob.md5_hash:
+                state[filename] = _blob_state(blob)
+                continue
+            changed.append(filename)
+        else:
+            added.append(filename)
+        downloads.append((filename, blob, local_path))
+
+    failed = []
+    if downloads:
+        print(f"⬇️ Сваляне на {len(downloads)} файла ({len(added)} нови, {len(changed)} променени)...")
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(downloads)))) as pool:
+            futures = {pool.submit(_download, blob, local_path): (filename, blob) for filename, blob, local_path in downloads}
+            for future, (filename, blob) in futures.items():
+                try:
+                    future.result()
+                    state[filename] = _blob_state(blob)
+                    print(f"⬇️ Свален файл: {filename}")
+                except Exception as e:
+                    failed.append(filename)
+                    print(f"❌ Неуспешно сваляне на {filename}: {e}")
+
+    # Изтритите от bucket-а – само тези, които sync-ът познава; локалните файлове не се пипат
+    removed = [filename for filename in state if filename not in remote]
+    for filename in removed:
+        local_path = os.path.join(local_dir, filename)
+        if delete_removed and os.path.exists(local_path):
+            os.remove(local_path)
+            print(f"🗑️ Изтрит файл: {filename}")
+        del state[filename]
+
+    save_sync_state(state, state_path)
+
+    added = [filename for filename in added if filename not in failed]
+    changed = [filename for filename in changed if filename not in failed]
+    changes = {"added": added, "changed": changed, "removed": removed}
+    record_sync_changes(changes, changes_path)
+    if not (added or changed or removed):
         print("✅ Няма нови субтитри за сваляне.")
+    else:
+        print(f"✅ Sync: {len(added)} нови, {len(changed)} променени, {len(removed)} изтрити.")
+    if failed:
+        # Състоянието на успешните е записано; неуспешните се опитват пак при следващия sync
+        raise RuntimeError(f"❌ Неуспешно сваляне на {len(failed)} файла: {', '.join(failed)}")
+
+    return changes
+
 
-    return downloaded
\ No newline at end of file
+# ▶️ Самостоятелен етап на /sync: сваля субтитрите веднъж, преди индексирането
+if __name__ == "__main__":
+    sync_subtitles_from_firebase()
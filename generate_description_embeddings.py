@@ -5,6 +5,7 @@ import numpy as np
 from dotenv import load_dotenv
 from sentence_transformers import SentenceTransformer
 import openai
+from utils.embedding_pipeline import embed_texts
 
 # 🔐 Зареждане на OpenAI API ключ
 load_dotenv()
@@ -19,9 +20,25 @@ MAPPING_PATH = "description_embeddings/description_mapping.pkl"
 from firebase_utils import sync_subtitles_from_firebase
 
 
+DESCRIPTION_MODEL = "all-MiniLM-L6-v2"
+
+
+class DescriptionEmbedder:
+    # Ненормализирани вектори (както в search_description.py) – затова отделно име в склада
+    name = "description"
+    max_concurrency = 1
+
+    def __init__(self, model):
+        self.model = model
+        self.model_name = DESCRIPTION_MODEL
+
+    def embed_documents(self, texts):
+        return self.model.encode(list(texts)).astype("float32").tolist()
+
+
 def get_embedding_model():
     # Зареждане на модела вътре във функция, за да избегнем segmentation fault
-    return SentenceTransformer("all-MiniLM-L6-v2")
+    return SentenceTransformer(DESCRIPTION_MODEL)
 
 
 def generate_full_description_from_title(filename):
@@ -46,8 +63,10 @@ Focus on key plot elements, characters, and unique traits.
 
 
 def main():
-    print("🔄 Синхронизиране със Firebase...")
-    sync_subtitles_from_firebase()
+    # При /sync субтитрите вече са свалени от отделен етап (SKIP_FIREBASE_SYNC=1)
+    if os.getenv("SKIP_FIREBASE_SYNC") != "1":
+        print("🔄 Синхронизиране със Firebase...")
+        sync_subtitles_from_firebase()
 
     # 🧠 Зареждане на embedding модела
     print("🧠 Зареждане на SentenceTransformer...")
@@ -65,21 +84,27 @@ def main():
         mapping = {}
 
     # 🔄 Обработка на .srt файлове
+    new_descriptions = {}
     for filename in os.listdir(SUBTITLES_DIR):
         if filename.endswith(".srt") and filename not in mapping:
             print(f"\n🎬 Обработка на {filename}...")
             description = generate_full_description_from_title(filename)
             if description:
                 print(f"✅ Описание: {description}")
-                try:
-                    embedding = model.encode([description])[0]
-                    faiss_index.add(np.array([embedding], dtype=np.float32))
-                    mapping[filename] = {"description": description}
-                except Exception as e:
-                    print(f"❌ Грешка при embedding за {filename}: {e}")
+                new_descriptions[filename] = description
             else:
                 print("⚠️ Пропуснат поради грешка.")
 
+    # 🗄️ Векторите минават през склада с embedding-и – вече виждани описания не се encode-ват
+    if new_descriptions:
+        try:
+            embeddings = embed_texts(DescriptionEmbedder(model), list(new_descriptions.values()))
+            faiss_index.add(embeddings)
+            for filename, description in new_descriptions.items():
+                mapping[filename] = {"description": description}
+        except Exception as e:
+            print(f"❌ Грешка при embedding на описанията: {e}")
+
     # 💾 Записване
     os.makedirs("description_embeddings", exist_ok=True)
     faiss.write_index(faiss_index, INDEX_PATH)
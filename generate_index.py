@@ -1,100 +1,222 @@
 from dotenv import load_dotenv
 import os
-import pickle
 import numpy as np
 import faiss
-from utils.subtitle_parser import parse_srt
-from langchain_community.embeddings import OpenAIEmbeddings
-from firebase_utils import sync_subtitles_from_firebase
+from utils.subtitle_parser import parse_files
+from utils.segmentation import segmentation_config
+from utils.near_duplicates import file_signature, find_duplicates
+from utils.scene_store import load_mapping, write_scene_store
+from utils.lexical_index import LexicalIndex
+from utils.index_factory import build_index, ensure_id_map, remove_ids
+from utils.movie_catalog import MovieCatalog, build_catalog
+from utils.subtitle_matcher import build_movie_timelines
+from utils.embedding_backends import get_backend
+from utils.embedding_pipeline import embed_texts
+from utils.file_manifest import (
+    load_manifest, save_manifest, bootstrap_manifest, diff_subtitle_files,
+    ids_to_ranges, ranges_to_ids,
+)
+from utils.index_paths import (
+    active_dir, current_version, index_path, mapping_path, lexical_path, legacy_mapping_path, file_manifest_path,
+    catalog_path,
+)
+from utils.index_versions import stage_version, publish_version
+from firebase_utils import sync_subtitles_from_firebase, current_sync_seq, unchanged_synced_files
 
 load_dotenv()
-print("FIREBASE_CREDENTIALS_PATH =", os.getenv("FIREBASE_CREDENTIALS_PATH"))
-print("BUCKET_NAME =", os.getenv("BUCKET_NAME"))
-openai_api_key = os.getenv("OPENAI_API_KEY")
-if not openai_api_key:
-    raise ValueError("❗ OPENAI_API_KEY не е намерен – провери .env файла!")
 
 SUBTITLES_FOLDER = "subtitles"
-INDEX_PATH = "embeddings/subtitle_index.faiss"
-MAPPING_PATH = "embeddings/subtitle_mapping.pkl"
-
-embedder = OpenAIEmbeddings(openai_api_key=openai_api_key)
-
-# Зареждаме вече съществуващи индекси и mapping, ако ги има
-if os.path.exists(INDEX_PATH) and os.path.exists(MAPPING_PATH):
-    index = faiss.read_index(INDEX_PATH)
-    with open(MAPPING_PATH, "rb") as f:
-        mapping = pickle.load(f)
-    print(f"🔁 Заредени {len(mapping)} стари embedding-и.")
-else:
-    index = None
-    mapping = {}
+# Индекси отпреди настройваемата сегментация са правени по 5 реплики на сцена
+LEGACY_SEGMENTATION = {"strategy": "cues", "params": {"max_cues": 5}}
+
+
+def load_existing(base):
+    # Зареждаме активната версия на индекса и mapping-а, ако има (стар pickle се мигрира)
+    existing_mapping_path = mapping_path(base=base)
+    if not os.path.exists(existing_mapping_path):
+        existing_mapping_path = legacy_mapping_path()
+    if os.path.exists(index_path(base=base)) and os.path.exists(existing_mapping_path):
+        index = ensure_id_map(faiss.read_index(index_path(base=base)))
+        mapping = dict(load_mapping(existing_mapping_path).items())
+        print(f"🔁 Заредени {len(mapping)} стари embedding-и.")
+        return index, mapping
     print("⚠️ Не са намерени съществуващи индекси – ще създадем нови.")
-
-vectors = []
-new_mapping = {}
-start_i = max(mapping.keys(), default=-1) + 1
-new_i = start_i
-
-existing_texts = set(item["lines"] for item in mapping.values())
-
-print("🟡 Обработка на нови субтитри...")
-
-sync_subtitles_from_firebase()
-
-for filename in os.listdir(SUBTITLES_FOLDER):
-    if filename.endswith(".srt"):
+    return None, {}
+
+
+def remove_files(index, mapping, manifest, filenames):
+    # Сцените на променени и изтрити файлове се махат от индекса и mapping-а
+    ids = []
+    for filename in filenames:
+        entry = manifest["files"].pop(filename)
+        ids.extend(ranges_to_ids(entry["ranges"]))
+    if not ids:
+        return index
+    for scene_id in ids:
+        mapping.pop(scene_id, None)
+    print(f"🗑️ Премахване на {len(ids)} сцени от {len(filenames)} файла...")
+    if index is not None:
+        index = remove_ids(index, ids)
+    return index
+
+
+def aliases_of_files(manifest, filenames, hashes):
+    # Псевдоними на филми, чиито файлове са променени или изтрити – проверяват се наново
+    movies = {manifest["files"][name]["movie"] for name in filenames if name in manifest["files"]}
+    return [
+        name for name, entry in manifest["files"].items()
+        if entry.get("alias_of") in movies and name in hashes and name not in filenames
+    ]
+
+
+def detect_duplicates(manifest, filenames, hashes):
+    """
+    👯 MinHash подписи на новите файлове, сравнени с вече индексираните.
+    Почти еднаквите се записват в манифеста като псевдоними (без сцени и embedding).
+    Връща (файловете за индексиране, подписите им).
+    """
+    known = {}
+    for name, entry in manifest["files"].items():
+        if entry.get("alias_of"):
+            continue
+        if entry.get("minhash") is None and name in hashes:
+            # Манифест отпреди подписите – файлът не е променян, смятаме го веднъж
+            entry["minhash"] = file_signature(os.path.join(SUBTITLES_FOLDER, name))
+        known[entry["movie"]] = entry.get("minhash")
+
+    signatures = {name: file_signature(os.path.join(SUBTITLES_FOLDER, name)) for name in sorted(filenames)}
+    aliases = find_duplicates({name[:-4]: signature for name, signature in signatures.items()}, known)
+
+    to_index = []
+    for name in sorted(filenames):
+        movie_name = name[:-4]
+        if movie_name not in aliases:
+            to_index.append(name)
+            continue
+        canonical, score = aliases[movie_name]
+        print(f"👯 {movie_name} е почти същият като {canonical} (сходство {score:.2f}) – без embedding.")
+        manifest["files"][name] = {
+            "hash": hashes[name],
+            "movie": movie_name,
+            "ranges": [],
+            "alias_of": canonical,
+            "similarity": round(score, 3),
+            "minhash": signatures[name],
+        }
+    return to_index, signatures
+
+
+def collect_scenes(manifest, filenames, hashes, segmentation, signatures=None):
+    # Нови id-та се раздават от next_id – изтритите id-та не се преизползват
+    new_mapping = {}
+    next_id = manifest["next_id"]
+    # Файловете се парсват паралелно в отделни процеси (SUBTITLE_PARSE_WORKERS)
+    parsed = parse_files([os.path.join(SUBTITLES_FOLDER, filename) for filename in filenames], segmentation)
+    for filename in filenames:
         movie_name = filename[:-4]
-        file_path = os.path.join(SUBTITLES_FOLDER, filename)
-        scenes = parse_srt(file_path)
-
-        # 🆕 Намираме последния timestamp за този филм
-        last_scene_timestamp = scenes[-1]["timestamp"] if scenes else None
-
+        scenes = parsed[os.path.join(SUBTITLES_FOLDER, filename)]
+        ids = []
         for scene in scenes:
             text = scene["text"].strip()
-            timestamp = scene["timestamp"]
-
-            if not text or text in existing_texts:
-                continue  # пропускаме дублирани или празни сцени
-
-            try:
-                vector = embedder.embed_query(text)
-                vectors.append(vector)
+            if not text:
+                continue  # пропускаме празни сцени
+            new_mapping[next_id] = {
+                "lines": text,
+                "timestamp": scene["timestamp"],
+                "movie": movie_name,
+            }
+            ids.append(next_id)
+            next_id += 1
+        manifest["files"][filename] = {
+            "hash": hashes[filename],
+            "movie": movie_name,
+            "ranges": ids_to_ranges(ids),
+            "duration_ms": max((scene["end_ms"] for scene in scenes), default=0),
+            "minhash": (signatures or {}).get(filename),
+        }
+    manifest["next_id"] = next_id
+    return new_mapping
+
+
+def main():
+    print("FIREBASE_CREDENTIALS_PATH =", os.getenv("FIREBASE_CREDENTIALS_PATH"))
+    print("BUCKET_NAME =", os.getenv("BUCKET_NAME"))
+
+    embedder = get_backend()
+    print(f"🔌 Embedding backend: {embedder.name} ({embedder.model_name})")
+
+    # Всеки backend (EMBEDDING_BACKEND) има отделен индекс; четем активната му версия
+    base = active_dir()
+    index, mapping = load_existing(base)
+
+    # При /sync субтитрите вече са свалени от отделен етап (SKIP_FIREBASE_SYNC=1)
+    if os.getenv("SKIP_FIREBASE_SYNC") != "1":
+        sync_subtitles_from_firebase()
+
+    manifest = load_manifest(file_manifest_path(base=base)) if index is not None else None
+    if manifest is None:
+        manifest = bootstrap_manifest(mapping, SUBTITLES_FOLDER)
+        if mapping:
+            print(f"🧾 Създаден манифест за {len(manifest['files'])} вече индексирани файла.")
+
+    # 🪣 Файловете, които sync-ът не е пипал след последното индексиране, не се hash-ват наново
+    sync_seq = current_sync_seq()
+    unchanged = unchanged_synced_files(manifest.get("firebase_sync_seq"))
+    if unchanged:
+        print(f"🪣 {len(unchanged)} файла не са променени от sync-а – hash-ът им е от манифеста.")
+    hashes, added, changed, removed = diff_subtitle_files(manifest, SUBTITLES_FOLDER, unchanged)
+    manifest["firebase_sync_seq"] = sync_seq
+
+    # ✂️ Друга сегментация (SUBTITLE_SEGMENTATION и параметрите ѝ) → всички файлове се сегментират наново
+    segmentation = segmentation_config()
+    if manifest.get("segmentation", LEGACY_SEGMENTATION) != segmentation and manifest["files"]:
+        print(f"✂️ Сегментацията е сменена на {segmentation} – всички файлове се индексират наново.")
+        changed = [name for name in manifest["files"] if name in hashes]
+    manifest["segmentation"] = segmentation
+    print(f"🟡 Файлове: {len(added)} нови, {len(changed)} променени, {len(removed)} изтрити.")
+
+    changed += aliases_of_files(manifest, changed + removed, hashes)
+
+    index = remove_files(index, mapping, manifest, changed + removed)
+    to_index, signatures = detect_duplicates(manifest, added + changed, hashes)
+    new_mapping = collect_scenes(manifest, to_index, hashes, segmentation, signatures)
+
+    # 🚚 Всички нови сцени се embed-ват наведнъж – на партиди, няколко паралелно
+    vectors = embed_texts(embedder, [entry["lines"] for entry in new_mapping.values()])
+    print(f"🆕 Нови embedding-и: {len(vectors)}")
+
+    if len(vectors):
+        ids = np.fromiter(new_mapping.keys(), dtype="int64", count=len(new_mapping))
+        if index is None:
+            index = build_index(vectors, ids=ids)  # вид според SUBTITLE_INDEX_TYPE
+        else:
+            index.add_with_ids(vectors, ids)  # вече обучен индекс – само добавяме
+        mapping.update(new_mapping)
+
+    if not (added or changed or removed) and (current_version() or not mapping):
+        print("ℹ️ Няма нови сцени за добавяне – всичко е актуално.")
+        return
 
-                entry = {
-                    "lines": text,
-                    "timestamp": timestamp,
-                    "movie": movie_name
-                }
-
-                # 🆕 Добавяме duration само веднъж (при първата сцена на този филм)
-                if movie_name not in [m["movie"] for m in new_mapping.values()]:
-                    entry["duration"] = last_scene_timestamp  # 🆕
-
-                new_mapping[new_i] = entry
-                new_i += 1
-                existing_texts.add(text)
-
-            except Exception as e:
-                print(f"🔴 Грешка при сцена: {e}")
-
-print(f"🆕 Нови embedding-и: {len(vectors)}")
-
-if vectors:
-    vectors_np = np.array(vectors).astype("float32")
     if index is None:
-        index = faiss.IndexFlatL2(vectors_np.shape[1])
-    index.add(vectors_np)
-
-    # Актуализираме mapping-а
-    mapping.update(new_mapping)
-
-    # Записваме
-    faiss.write_index(index, INDEX_PATH)
-    with open(MAPPING_PATH, "wb") as f:
-        pickle.dump(mapping, f)
-
-    print(f"✅ Добавени {len(new_mapping)} нови сцени към индекса.")
-else:
-    print("ℹ️ Няма нови сцени за добавяне – всичко е актуално.")
+        print("ℹ️ Няма останали сцени – индексът не се записва.")
+        return
+
+    # Новата версия се пише в отделна папка и се публикува наведнъж – сървърът
+    # продължава да чете старата, докато CURRENT не бъде подменен.
+    # Индекс без версии (и стар pickle mapping) се мигрира тук, дори без промени.
+    version, staging = stage_version()
+    faiss.write_index(index, index_path(base=staging))
+    write_scene_store(mapping_path(base=staging), mapping)
+    LexicalIndex.build(mapping).save(lexical_path(base=staging))  # 🔤 BM25 индекс до FAISS файла
+    save_manifest(file_manifest_path(base=staging), manifest)
+    # 🎬 Каталог на филмите; id-тата на вече известните филми се запазват
+    previous_catalog = MovieCatalog.load(catalog_path(base=base)) if os.path.exists(catalog_path(base=base)) else None
+    catalog = build_catalog(build_movie_timelines(mapping), manifest, previous_catalog)
+    catalog.save(catalog_path(base=staging))
+    publish_version(version, staging, info={"scenes": len(mapping), "vectors": int(index.ntotal), "movies": len(catalog)})
+
+    print(f"✅ Индексът е обновен: +{len(new_mapping)} сцени, общо {len(mapping)}.")
+
+
+if __name__ == "__main__":
+    main()
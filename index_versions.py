@@ -0,0 +1,86 @@
+import argparse
+
+from utils.index_paths import current_version
+from utils.index_versions import (
+    list_versions, read_version_manifest, verify_version, rollback, set_current, prune_versions,
+    INDEX_KEEP_VERSIONS,
+)
+
+# 🗃️ Управление на версиите на индекса на субтитрите:
+#   python index_versions.py list
+#   python index_versions.py verify [версия]
+#   python index_versions.py rollback [версия]   (без версия → предишната)
+#   python index_versions.py prune --keep 3
+# Работещият сървър вижда смяната на CURRENT при следващата заявка.
+
+
+def cmd_list(args):
+    active = current_version(args.backend)
+    versions = list_versions(args.backend)
+    if not versions:
+        print("ℹ️ Няма публикувани версии.")
+        return
+    for version in versions:
+        manifest = read_version_manifest(version, args.backend)
+        info = manifest.get("info", {})
+        marker = "👉" if version == active else "  "
+        print(f"{marker} {version}  сцени: {info.get('scenes', '?')}  създадена: {manifest['created']}")
+
+
+def cmd_verify(args):
+    version = args.version or current_version(args.backend)
+    if not version:
+        print("ℹ️ Няма активна версия.")
+        return 1
+    problems = verify_version(version, args.backend)
+    if problems:
+        print(f"❌ Версия {version}:")
+        for problem in problems:
+            print(f" - {problem}")
+        return 1
+    print(f"✅ Версия {version} е цяла.")
+    return 0
+
+
+def cmd_rollback(args):
+    rollback(args.version, args.backend)
+
+
+def cmd_activate(args):
+    set_current(args.version, args.backend)
+    print(f"✅ Активна версия: {args.version}")
+
+
+def cmd_prune(args):
+    prune_versions(args.keep, args.backend)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Версии на FAISS индекса на субтитрите")
+    parser.add_argument("--backend", default=None, help="embedding backend (по подразбиране EMBEDDING_BACKEND)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list").set_defaults(func=cmd_list)
+
+    verify = commands.add_parser("verify")
+    verify.add_argument("version", nargs="?")
+    verify.set_defaults(func=cmd_verify)
+
+    back = commands.add_parser("rollback")
+    back.add_argument("version", nargs="?")
+    back.set_defaults(func=cmd_rollback)
+
+    activate = commands.add_parser("activate")
+    activate.add_argument("version")
+    activate.set_defaults(func=cmd_activate)
+
+    prune = commands.add_parser("prune")
+    prune.add_argument("--keep", type=int, default=INDEX_KEEP_VERSIONS)
+    prune.set_defaults(func=cmd_prune)
+
+    args = parser.parse_args()
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
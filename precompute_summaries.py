@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from utils.scene_store import load_mapping
+from utils.movie_catalog import load_or_build_catalog, summary_key
+from utils.subtitle_matcher import build_movie_timelines
+from utils.index_paths import mapping_path, catalog_path
+from utils.summary_cache import SUMMARY_CACHE_PATH, SummaryCache, set_default_cache
+from utils.subtitle_summarizer import (
+    LANGUAGE_MAP, SUMMARY_MODE, SUMMARY_LEAF_SCENES, SUMMARY_FANOUT, SUMMARY_PROMPT_VERSION,
+    CHUNK_ERROR_PLACEHOLDER, summarize_until_now, summarize_chunks, extract_character_profiles,
+)
+
+load_dotenv()
+
+# 🗂️ Предварително обобщаване на всички филми от каталога (след /sync), за да не плаща
+# /summarize за LLM при заявка. Пише в кеша на обобщенията (SUMMARY_CACHE_PATH) със закачени
+# записи: всички листа и сливания на дървото, чънковете по 5 сцени, обобщението и профилите
+# на героите за целия филм (и на всеки --checkpoint сцени). Заявка за произволен момент
+# тогава досмята само последното непълно листо, няколко сливания и финала.
+PRECOMPUTE_STATE_PATH = os.getenv("PRECOMPUTE_STATE_PATH", "cache/precompute_state.json")
+PRECOMPUTE_WORKERS = int(os.getenv("PRECOMPUTE_WORKERS", "2"))  # филм × език наведнъж; всеки с SUMMARY_WORKERS
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(path, state):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def job_signature(row, mode, checkpoint):
+    # Задачата е готова само за същия файл и сегментация, промпти и форма на дървото
+    return {
+        "file_hash": summary_key(row),
+        "mode": mode,
+        "shape": f"{SUMMARY_LEAF_SCENES}x{SUMMARY_FANOUT}",
+        "prompt_version": SUMMARY_PROMPT_VERSION,
+        "checkpoint": checkpoint,
+    }
+
+
+def precompute_movie(movie, file_hash, scenes, language, mode, checkpoint):
+    """
+    Връща None при успех или описание на проблема. Грешките на отделни LLM извиквания
+    не се кешират, така че при следващото пускане се досмятат само те.
+    """
+    points = list(range(checkpoint, len(scenes), checkpoint)) if checkpoint else []
+    points.append(len(scenes))
+
+    for count in points:
+        summary = summarize_until_now(scenes[:count], movie_name=movie, language=language, mode=mode,
+                                      file_hash=file_hash)
+        if summary.startswith("⚠️"):
+            return f"обобщение на сцени 1–{count}: {summary}"
+        extract_character_profiles(summary, movie_name=movie, language=language,
+                                   file_hash=file_hash, scene_count=count)
+
+    chunk_summaries = summarize_chunks(scenes, movie_name=movie, language=language, file_hash=file_hash)
+    failed = sum(1 for chunk_summary in chunk_summaries if chunk_summary == CHUNK_ERROR_PLACEHOLDER)
+    if failed:
+        return f"{failed} неуспешни чънка"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Предварително обобщаване на филмите в кеша на обобщенията")
+    parser.add_argument("--backend", default=None, help="индексът на кой embedding backend (по подразбиране EMBEDDING_BACKEND)")
+    parser.add_argument("--movies", default="", help="филми, разделени със запетая (по подразбиране – всички)")
+    parser.add_argument("--languages", default=",".join(LANGUAGE_MAP), help="езици, разделени със запетая")
+    parser.add_argument("--mode", default=SUMMARY_MODE, choices=["tree", "sequential"])
+    parser.add_argument("--checkpoint", type=int, default=0,
+                        help="обобщение и профили и на всеки N сцени, не само за целия филм")
+    parser.add_argument("--workers", type=int, default=PRECOMPUTE_WORKERS)
+    parser.add_argument("--cache", default=SUMMARY_CACHE_PATH)
+    parser.add_argument("--state", default=PRECOMPUTE_STATE_PATH)
+    parser.add_argument("--force", action="store_true", help="пусни и вече готовите задачи")
+    args = parser.parse_args()
+
+    if not args.cache:
+        raise ValueError("❌ Кешът на обобщенията е изключен (SUMMARY_CACHE_PATH е празно).")
+    # Всичко, записано от този процес, е закачено – лимитът на кеша не го трие
+    set_default_cache(SummaryCache(args.cache, pin=True))
+
+    mapping = load_mapping(mapping_path(args.backend))
+    timelines = build_movie_timelines(mapping)
+    catalog = load_or_build_catalog(catalog_path(args.backend), timelines)
+
+    movies = [name.strip() for name in args.movies.split(",") if name.strip()]
+    movies = [catalog.resolve(name) or name for name in movies] if movies else [row["movie"] for row in catalog]
+    languages = [language.strip() for language in args.languages.split(",") if language.strip()]
+
+    state = load_state(args.state)
+    state_lock = threading.Lock()
+    jobs = []
+    for movie in movies:
+        row = catalog.get(movie)
+        if row is None or movie not in timelines:
+            print(f"⚠️ {movie}: няма го в индекса – пропускаме.")
+            continue
+        file_hash = summary_key(row)
+        if not file_hash:
+            print(f"⚠️ {movie}: каталогът няма hash на файла или сегментация – кешът не може да се ползва.")
+            continue
+        for language in languages:
+            key = f"{movie}|{language}"
+            signature = job_signature(row, args.mode, args.checkpoint)
+            if not args.force and state.get(key) == signature:
+                continue
+            jobs.append((key, signature, movie, file_hash, language))
+
+    print(f"🗂️ {len(jobs)} задачи (филм × език), {args.workers} наведнъж; "
+          f"{len(movies) * len(languages) - len(jobs)} вече са готови.")
+
+    def run(job):
+        key, signature, movie, file_hash, language = job
+        scenes = [mapping[scene_id]["lines"] for scene_id in timelines[movie].scene_ids]
+        started = time.perf_counter()
+        problem = precompute_movie(movie, file_hash, scenes, language, args.mode, args.checkpoint)
+        if problem is None:
+            # ✅ Checkpoint след всяка завършена задача – прекъснат скрипт продължава оттук
+            with state_lock:
+                state[key] = signature
+                save_state(args.state, state)
+        return key, problem, time.perf_counter() - started
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = [pool.submit(run, job) for job in jobs]
+        for future in as_completed(futures):
+            try:
+                key, problem, seconds = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {e}")
+                continue
+            if problem is None:
+                print(f"✅ {key} за {seconds:.1f}s")
+            else:
+                failed += 1
+                print(f"⚠️ {key}: {problem} – ще се досметне при следващото пускане")
+
+    print(f"🏁 Готово: {len(jobs) - failed} успешни, {failed} неуспешни.")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
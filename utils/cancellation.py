@@ -0,0 +1,3 @@
+# 🟦 Регистър за отменени заявки (/cancel) – в отделен модул, за да го ползват и
+# скриптове извън Flask (напр. precompute_summaries.py), без да импортират app.py
+cancelled_requests = set()
@@ -0,0 +1,92 @@
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 🔌 Кой модел прави embedding-ите на субтитрите: "openai" (по подразбиране) или "local"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", "0"))  # 0 → по подразбиране на torch
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "64"))
+
+# Праг за L2 дистанцията при търсене – различните модели имат различно разпределение
+OPENAI_MATCH_THRESHOLD = float(os.getenv("OPENAI_MATCH_THRESHOLD", "0.35"))
+LOCAL_MATCH_THRESHOLD = float(os.getenv("LOCAL_MATCH_THRESHOLD", "0.6"))
+
+
+class OpenAIBackend:
+    name = "openai"
+
+    def __init__(self):
+        from langchain.embeddings import OpenAIEmbeddings
+
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("❌ Липсва OPENAI_API_KEY в .env файла!")
+        self.embeddings = OpenAIEmbeddings(openai_api_key=api_key)
+        self.model_name = getattr(self.embeddings, "model", "openai")
+        self.match_threshold = OPENAI_MATCH_THRESHOLD
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(list(texts))
+
+
+class LocalBackend:
+    """
+    Локален SentenceTransformer модел на CPU – без мрежа и без API лимити.
+    Векторите се нормализират, за да са L2 дистанциите сравними между заявките.
+    """
+
+    name = "local"
+    max_concurrency = 1  # encode вече използва всички torch нишки
+
+    def __init__(self, model_name=LOCAL_EMBEDDING_MODEL, threads=LOCAL_EMBEDDING_THREADS,
+                 batch_size=LOCAL_EMBEDDING_BATCH_SIZE):
+        # Зареждане вътре във функцията, за да не се тегли torch, когато не е нужен
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads > 0:
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.match_threshold = LOCAL_MATCH_THRESHOLD
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def embed_documents(self, texts):
+        vectors = self.model.encode(
+            list(texts),
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        return vectors.astype("float32").tolist()
+
+
+BACKENDS = {
+    OpenAIBackend.name: OpenAIBackend,
+    LocalBackend.name: LocalBackend,
+}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_backend(name=None):
+    # Една инстанция на backend за процеса – моделът не се зарежда при всяка заявка
+    name = name or EMBEDDING_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"❌ Непознат embedding backend: {name} (възможни: {', '.join(BACKENDS)})")
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = BACKENDS[name]()
+        return _instances[name]
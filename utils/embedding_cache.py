@@ -0,0 +1,138 @@
+import os
+import time
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", str(30 * 24 * 3600)))  # секунди
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")  # празно → само в паметта
+EMBEDDING_CACHE_DISK_SIZE = int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", "200000"))
+
+
+def normalize_text(text):
+    # "You can't  handle the TRUTH" и "you can't handle the truth" дават един и същ ключ
+    text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.casefold().split())
+
+
+class EmbeddingCache:
+    """
+    LRU кеш за embedding-и на заявки с TTL. Ключът е (модел, нормализиран текст),
+    така че смяната на модела никога не връща вектор от друг модел.
+    При зададен path записите се пазят и в sqlite, за да оцелеят рестарт.
+    """
+
+    def __init__(self, max_items=EMBEDDING_CACHE_SIZE, ttl_seconds=EMBEDDING_CACHE_TTL,
+                 path=EMBEDDING_CACHE_PATH, max_disk_items=EMBEDDING_CACHE_DISK_SIZE):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_items = max_disk_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._puts_since_trim = 0
+        if path:
+            self._open_db(path)
+
+    def _open_db(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL, created REAL NOT NULL,"
+            " PRIMARY KEY (model, text))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_created ON embeddings (created)")
+        self._db.commit()
+
+    def _expired(self, created, now):
+        return self.ttl_seconds > 0 and now - created > self.ttl_seconds
+
+    def get(self, model, text):
+        key = (model, normalize_text(text))
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                vector, created = item
+                if not self._expired(created, now):
+                    self._items.move_to_end(key)
+                    return vector
+                del self._items[key]
+
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT vector, created FROM embeddings WHERE model = ? AND text = ?", key
+            ).fetchone()
+            if row is None:
+                return None
+            if self._expired(row[1], now):
+                self._db.execute("DELETE FROM embeddings WHERE model = ? AND text = ?", key)
+                self._db.commit()
+                return None
+
+            vector = np.frombuffer(row[0], dtype="float32").tolist()
+            self._remember(key, vector, row[1])
+            return vector
+
+    def put(self, model, text, vector):
+        key = (model, normalize_text(text))
+        created = time.time()
+        with self._lock:
+            self._remember(key, list(vector), created)
+            if self._db is None:
+                return
+            blob = np.asarray(vector, dtype="float32").tobytes()
+            self._db.execute(
+                "INSERT OR REPLACE INTO embeddings (model, text, vector, created) VALUES (?, ?, ?, ?)",
+                (key[0], key[1], blob, created),
+            )
+            self._db.commit()
+            self._puts_since_trim += 1
+            if self._puts_since_trim >= 100:
+                self._trim_disk(created)
+
+    def _remember(self, key, vector, created):
+        self._items[key] = (vector, created)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def _trim_disk(self, now):
+        # Изтриваме изтеклите и най-старите записи над лимита
+        self._puts_since_trim = 0
+        if self.ttl_seconds > 0:
+            self._db.execute("DELETE FROM embeddings WHERE created < ?", (now - self.ttl_seconds,))
+        self._db.execute(
+            "DELETE FROM embeddings WHERE rowid IN ("
+            " SELECT rowid FROM embeddings ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_items,),
+        )
+        self._db.commit()
+
+    def __len__(self):
+        return len(self._items)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    # Един кеш за целия процес – споделя се от всички SimpleEmbedder инстанции
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+        return _default_cache
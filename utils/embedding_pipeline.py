@@ -0,0 +1,132 @@
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from dotenv import load_dotenv
+
+from utils.embedding_cache import normalize_text
+from utils.embedding_store import EMBEDDING_STORE_SHARD_SIZE, get_default_store
+
+load_dotenv()
+
+# 🚚 Embedding на сцени на партиди, с няколко партиди едновременно
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+EMBED_BACKOFF_SECONDS = float(os.getenv("EMBED_BACKOFF_SECONDS", "1.0"))
+
+
+class EmbeddingBatchError(Exception):
+    pass
+
+
+def _embed_batch(backend, texts, batch_no, max_retries, backoff):
+    for attempt in range(max_retries + 1):
+        try:
+            vectors = backend.embed_documents(texts)
+            if len(vectors) != len(texts):
+                raise EmbeddingBatchError(f"получени {len(vectors)} вектора за {len(texts)} текста")
+            return vectors
+        except Exception as e:
+            if attempt == max_retries:
+                raise EmbeddingBatchError(
+                    f"❌ Партида {batch_no} се провали след {max_retries + 1} опита: {e}"
+                ) from e
+            # Експоненциално изчакване с малко случайност, за да не удряме лимита едновременно
+            delay = backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+            print(f"🔁 Партида {batch_no}: {e} – нов опит след {delay:.1f}s")
+            time.sleep(delay)
+
+
+def model_key(backend):
+    return f"{backend.name}:{backend.model_name}"
+
+
+def embed_texts(backend, texts, batch_size=EMBED_BATCH_SIZE, workers=EMBED_WORKERS,
+                max_retries=EMBED_MAX_RETRIES, backoff=EMBED_BACKOFF_SECONDS, store=None):
+    """
+    Връща float32 матрица с по един ред за всеки текст, в същия ред.
+    Текстовете, които вече са в склада с embedding-и (store, по подразбиране
+    EMBEDDING_STORE_DIR), не се пращат към модела, а новите вектори се записват там.
+    """
+    texts = list(texts)
+    if not texts:
+        return np.empty((0, 0), dtype="float32")
+
+    if store is None:
+        store = get_default_store()
+    if store is None:
+        return _embed_all(backend, texts, batch_size, workers, max_retries, backoff)
+
+    model = model_key(backend)
+    vectors, missing = store.get_many(model, texts)
+    print(f"🗄️ От склада: {len(texts) - len(missing)}/{len(texts)} сцени, за embedding: {len(missing)}")
+    if missing:
+        # Текстове с един и същ ключ се embed-ват веднъж и получават един и същ вектор
+        groups = {}
+        for i in missing:
+            groups.setdefault(normalize_text(texts[i]), []).append(i)
+        unique_texts = [texts[positions[0]] for positions in groups.values()]
+        fresh = _embed_all(backend, unique_texts, batch_size, workers, max_retries, backoff,
+                           on_batch=lambda batch, batch_vectors: store.put_many(model, batch, batch_vectors))
+        for positions, vector in zip(groups.values(), fresh):
+            for i in positions:
+                vectors[i] = vector
+    return np.array(vectors, dtype="float32")
+
+
+def _embed_all(backend, texts, batch_size, workers, max_retries, backoff, on_batch=None):
+    """
+    Неуспешна партида се опитва отново; ако и това не помогне, се вдига грешка,
+    вместо сцени да изчезнат тихо от индекса. on_batch(texts, vectors) получава
+    готовите партиди, събрани до EMBEDDING_STORE_SHARD_SIZE – и при грешка,
+    за да не се плаща отново за вече направеното.
+    """
+    # Локалният модел вече използва всички ядра – паралелни партиди не помагат
+    workers = max(1, min(workers, getattr(backend, "max_concurrency", workers)))
+    batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+    results = [None] * len(batches)
+
+    done = 0
+    done_lock = threading.Lock()
+    pending = []
+    started = time.perf_counter()
+
+    def flush():
+        if on_batch and pending:
+            on_batch([text for batch_no in pending for text in batches[batch_no]],
+                     [vector for batch_no in pending for vector in results[batch_no]])
+        pending.clear()
+
+    def run(batch_no):
+        nonlocal done
+        results[batch_no] = _embed_batch(backend, batches[batch_no], batch_no + 1, max_retries, backoff)
+        with done_lock:
+            done += len(batches[batch_no])
+            elapsed = time.perf_counter() - started
+            print(f"🧠 Embedding: {done}/{len(texts)} сцени ({done / max(elapsed, 1e-9):.1f} сцени/сек)")
+            pending.append(batch_no)
+            if len(pending) * batch_size >= EMBEDDING_STORE_SHARD_SIZE:
+                flush()
+
+    print(f"🚚 {len(texts)} сцени в {len(batches)} партиди по {batch_size}, {workers} паралелно")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run, batch_no) for batch_no in range(len(batches))]
+        try:
+            for future in futures:
+                future.result()
+        except Exception:
+            # Останалите партиди нямат смисъл – индексът така или иначе няма да се запише
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            pool.shutdown(wait=True)
+            flush()
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Embedding готов: {len(texts)} сцени за {elapsed:.1f}s ({len(texts) / max(elapsed, 1e-9):.1f} сцени/сек)")
+    return np.array([vector for batch in results for vector in batch], dtype="float32")
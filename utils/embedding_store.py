@@ -0,0 +1,127 @@
+import os
+import hashlib
+import threading
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from utils.embedding_cache import normalize_text
+
+load_dotenv()
+
+# 🗄️ Постоянен склад за embedding-и на документи (сцени, описания).
+# Ключът е sha256(модел + нормализиран текст), векторите са float32 в шардове,
+# които само се добавят – нищо не се пренаписва, затова пълно преиндексиране
+# след смяна на настройките чете от диска вместо да вика модела отново.
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "embeddings/store")  # празно → изключен
+EMBEDDING_STORE_SHARD_SIZE = int(os.getenv("EMBEDDING_STORE_SHARD_SIZE", "10000"))
+
+KEY_BYTES = 16
+
+
+def embedding_key(model, text):
+    digest = hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).digest()
+    return digest[:KEY_BYTES]
+
+
+class EmbeddingStore:
+    """
+    Всеки шард е двойка файлове <име>.keys.npy (ключове) и <име>.vectors.npy (вектори).
+    Векторите се четат през memmap, а в паметта се държи само ключ → (шард, ред).
+    Няколко процеса могат да пишат едновременно – всеки шард има уникално име
+    и се появява атомарно (първо векторите, после ключовете).
+    """
+
+    def __init__(self, path=EMBEDDING_STORE_DIR):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._shards = {}     # име → memmap с вектори
+        self._locations = {}  # ключ → (име на шард, ред)
+        self._seq = 0
+        self.refresh()
+
+    def refresh(self):
+        # Зарежда шардове, записани след отварянето (напр. от друг процес)
+        names = sorted(name[:-len(".keys.npy")] for name in os.listdir(self.path) if name.endswith(".keys.npy"))
+        with self._lock:
+            for name in names:
+                if name in self._shards:
+                    continue
+                keys = np.load(os.path.join(self.path, f"{name}.keys.npy"))
+                vectors = np.load(os.path.join(self.path, f"{name}.vectors.npy"), mmap_mode="r")
+                self._shards[name] = vectors
+                for row, key in enumerate(keys):
+                    self._locations[key.tobytes()] = (name, row)
+
+    def __len__(self):
+        return len(self._locations)
+
+    def __contains__(self, key):
+        return key in self._locations
+
+    def get_many(self, model, texts):
+        """
+        Връща (vectors, missing): vectors[i] е float32 вектор или None,
+        missing са позициите на текстовете, които трябва да се embed-нат.
+        """
+        vectors = [None] * len(texts)
+        missing = []
+        with self._lock:
+            for i, text in enumerate(texts):
+                location = self._locations.get(embedding_key(model, text))
+                if location is None:
+                    missing.append(i)
+                    continue
+                name, row = location
+                vectors[i] = np.array(self._shards[name][row], dtype="float32")
+        return vectors, missing
+
+    def put_many(self, model, texts, vectors):
+        # Записва нов шард само с ключовете, които още ги няма
+        vectors = np.asarray(vectors, dtype="float32")
+        with self._lock:
+            keys, rows = [], []
+            seen = set()
+            for i, text in enumerate(texts):
+                key = embedding_key(model, text)
+                if key in self._locations or key in seen:
+                    continue
+                seen.add(key)
+                keys.append(key)
+                rows.append(i)
+            if not keys:
+                return 0
+
+            self._seq += 1
+            name = f"{time.time_ns():020d}-{os.getpid()}-{self._seq}"
+            shard_vectors = np.ascontiguousarray(vectors[rows])
+            self._write_npy(f"{name}.vectors.npy", shard_vectors)
+            self._write_npy(f"{name}.keys.npy", np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(-1, KEY_BYTES))
+
+            self._shards[name] = np.load(os.path.join(self.path, f"{name}.vectors.npy"), mmap_mode="r")
+            for row, key in enumerate(keys):
+                self._locations[key] = (name, row)
+        return len(keys)
+
+    def _write_npy(self, filename, array):
+        final_path = os.path.join(self.path, filename)
+        tmp_path = f"{final_path}.tmp-{os.getpid()}.npy"
+        np.save(tmp_path, array)
+        os.replace(tmp_path, final_path)
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store():
+    # Един склад за процеса; None, ако EMBEDDING_STORE_DIR е празно
+    global _default_store
+    if not EMBEDDING_STORE_DIR:
+        return None
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = EmbeddingStore()
+        return _default_store
@@ -0,0 +1,104 @@
+import os
+import json
+import hashlib
+
+# 🧾 Манифест на индексираните .srt файлове:
+#   {"format": 1, "next_id": N,
+#    "files": {"Whiplash.srt": {"hash": "...", "movie": "Whiplash", "ranges": [[start, end], ...]}}}
+# ranges са полуотворени интервали [start, end) от id-та във FAISS индекса,
+# които принадлежат на файла – при промяна или изтриване се махат само те.
+# "minhash" е подписът на текста (utils/near_duplicates.py); почти еднакъв файл няма
+# ranges, а "alias_of" сочи филма, чиито сцени се ползват вместо неговите.
+# "firebase_sync_seq" е номерът от дневника на Firebase sync-а (firebase_utils.py), до който
+# файловете са индексирани – свалените след него файлове са единствените, които се hash-ват наново.
+MANIFEST_FORMAT = 1
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def ids_to_ranges(ids):
+    ranges = []
+    for scene_id in sorted(int(i) for i in ids):
+        if ranges and ranges[-1][1] == scene_id:
+            ranges[-1][1] = scene_id + 1
+        else:
+            ranges.append([scene_id, scene_id + 1])
+    return ranges
+
+
+def ranges_to_ids(ranges):
+    return [scene_id for start, end in ranges for scene_id in range(start, end)]
+
+
+def empty_manifest():
+    return {"format": MANIFEST_FORMAT, "next_id": 0, "files": {}}
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != MANIFEST_FORMAT:
+        raise ValueError(f"❌ Неподдържан формат на манифеста: {manifest.get('format')}")
+    return manifest
+
+
+def save_manifest(path, manifest):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def list_subtitle_files(subtitles_dir):
+    return sorted(name for name in os.listdir(subtitles_dir) if name.endswith(".srt"))
+
+
+def bootstrap_manifest(mapping, subtitles_dir):
+    """
+    Манифест за индекс, създаден преди манифестите: сцените се разпределят по
+    файлове според полето movie, а текущият hash на файла се приема за индексиран.
+    """
+    manifest = empty_manifest()
+    per_movie = {}
+    for scene_id, entry in mapping.items():
+        per_movie.setdefault(entry["movie"], []).append(int(scene_id))
+
+    for movie, ids in per_movie.items():
+        filename = movie + ".srt"
+        path = os.path.join(subtitles_dir, filename)
+        manifest["files"][filename] = {
+            "hash": file_sha256(path) if os.path.exists(path) else None,
+            "movie": movie,
+            "ranges": ids_to_ranges(ids),
+        }
+
+    manifest["next_id"] = max((int(i) for i in mapping.keys()), default=-1) + 1
+    return manifest
+
+
+def diff_subtitle_files(manifest, subtitles_dir, unchanged=()):
+    """
+    Сравнява файловете на диска с манифеста.
+    Връща (hashes, added, changed, removed), където hashes е текущият hash на всеки файл.
+    За файловете в unchanged (непроменени от Firebase sync-а) се взима hash-ът от манифеста.
+    """
+    known = manifest["files"]
+    hashes = {}
+    for name in list_subtitle_files(subtitles_dir):
+        if name in unchanged and known.get(name, {}).get("hash"):
+            hashes[name] = known[name]["hash"]
+        else:
+            hashes[name] = file_sha256(os.path.join(subtitles_dir, name))
+
+    added = [name for name in hashes if name not in known]
+    changed = [name for name in hashes if name in known and known[name]["hash"] != hashes[name]]
+    removed = [name for name in known if name not in hashes]
+    return hashes, added, changed, removed
@@ -10,7 +10,7 @@ def generate_visual_prompt(summary: str, request_id=None) -> str:
     """
     Генерира изключително прост и стилово строго ограничен prompt, подходящ за DALL·E, с фокус върху плоски илюстрации в cartoon стил.
     """
-    from app import cancelled_requests
+    from utils.cancellation import cancelled_requests
     if request_id and request_id in cancelled_requests:
         print(f"[CANCEL] Прекъсване на функцията generate_visual_prompt за заявка {request_id}")
         cancelled_requests.discard(request_id)
@@ -54,7 +54,7 @@ def generate_image(prompt: str, size="1024x1024", request_id=None) -> str:
     """
     Изпраща визуален prompt към DALL·E и връща URL на изображението.
     """
-    from app import cancelled_requests
+    from utils.cancellation import cancelled_requests
     if request_id and request_id in cancelled_requests:
         print(f"[CANCEL] Прекъсване на функцията generate_image за заявка {request_id}")
         cancelled_requests.discard(request_id)
@@ -81,7 +81,7 @@ def generate_images_from_summaries(summaries: list[str], chunk_size: int = 5, si
     Връща списък от речници: {index, visual_prompt, image_url}.
     """
     images = []
-    from app import cancelled_requests  # ✅ за да проверяваме cancel глобално
+    from utils.cancellation import cancelled_requests  # ✅ за да проверяваме cancel глобално
 
     for i in range(0, len(summaries), chunk_size):
         if request_id and request_id in cancelled_requests:
@@ -0,0 +1,205 @@
+import os
+import math
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 🧱 Видове FAISS индекси за субтитрите:
+#   flat      – точно търсене (brute force), без обучение
+#   ivf_flat  – инвертиран индекс с nlist клъстера, търси в nprobe от тях
+#   ivf_pq    – IVF + product quantization (компресирани вектори, най-малко памет)
+#   hnsw      – граф за приблизително търсене, без обучение, контролира се с efSearch
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+INDEX_TYPE = os.getenv("SUBTITLE_INDEX_TYPE", "flat")
+INDEX_NLIST = int(os.getenv("SUBTITLE_INDEX_NLIST", "0"))  # 0 → избира се според броя вектори
+INDEX_PQ_M = int(os.getenv("SUBTITLE_INDEX_PQ_M", "64"))
+INDEX_PQ_BITS = int(os.getenv("SUBTITLE_INDEX_PQ_BITS", "8"))
+INDEX_HNSW_M = int(os.getenv("SUBTITLE_INDEX_HNSW_M", "32"))
+INDEX_EF_CONSTRUCTION = int(os.getenv("SUBTITLE_INDEX_EF_CONSTRUCTION", "40"))
+
+# Параметри при търсене
+INDEX_NPROBE = int(os.getenv("SUBTITLE_INDEX_NPROBE", "16"))
+INDEX_EF_SEARCH = int(os.getenv("SUBTITLE_INDEX_EF_SEARCH", "64"))
+
+
+def default_nlist(count):
+    # ~4·√n клъстера, но поне 39 вектора за обучение на клъстер
+    return max(1, min(int(4 * math.sqrt(count)), count // 39))
+
+
+def _pq_subquantizers(dim, wanted):
+    # PQ изисква размерността да се дели на броя подквантизатори
+    m = min(wanted, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def factory_string(index_type, dim, count, nlist=None, pq_m=None, pq_bits=None, hnsw_m=None):
+    if index_type == "flat":
+        return "Flat"
+    if index_type in ("ivf_flat", "ivf_pq"):
+        nlist = nlist or INDEX_NLIST or default_nlist(count)
+        if index_type == "ivf_flat":
+            return f"IVF{nlist},Flat"
+        m = _pq_subquantizers(dim, pq_m or INDEX_PQ_M)
+        return f"IVF{nlist},PQ{m}x{pq_bits or INDEX_PQ_BITS}"
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m or INDEX_HNSW_M},Flat"
+    raise ValueError(f"❌ Непознат тип индекс: {index_type} (възможни: {', '.join(INDEX_TYPES)})")
+
+
+def build_index(vectors, index_type=None, nlist=None, pq_m=None, pq_bits=None,
+                hnsw_m=None, ef_construction=None, ids=None):
+    """
+    Създава, обучава (ако е нужно) и пълни FAISS индекс от матрица с вектори.
+    Всички видове използват L2 метрика, за да важат същите прагове при търсене.
+    При подадени ids векторите се добавят с тези id-та: IVF ги пази в inverted
+    списъците си, а flat и HNSW се обвиват в IndexIDMap2.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    count, dim = vectors.shape
+    index_type = index_type or INDEX_TYPE
+
+    if index_type == "ivf_pq" and count < 2 ** (pq_bits or INDEX_PQ_BITS):
+        raise ValueError(f"❌ Твърде малко вектори ({count}) за обучение на IVF-PQ индекс.")
+
+    description = factory_string(index_type, dim, count, nlist, pq_m, pq_bits, hnsw_m)
+    if ids is not None and index_type in ("flat", "hnsw"):
+        description = "IDMap2," + description
+    index = faiss.index_factory(dim, description, faiss.METRIC_L2)
+
+    if index_type == "hnsw":
+        _unwrap(index).hnsw.efConstruction = ef_construction or INDEX_EF_CONSTRUCTION
+
+    if not index.is_trained:
+        print(f"🏋️ Обучение на {description} върху {count} вектора...")
+        index.train(vectors)
+
+    if ids is not None:
+        inner = _unwrap(index)
+        if isinstance(inner, faiss.IndexIVF):
+            inner.set_direct_map_type(faiss.DirectMap.Hashtable)
+        index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+    else:
+        index.add(vectors)
+    configure_search(index)
+    return index
+
+
+def has_own_ids(index):
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return True
+    return isinstance(index, faiss.IndexIVF) and index.direct_map.type == faiss.DirectMap.Hashtable
+
+
+def index_ids(index):
+    # Всички id-та в индекса (IndexIDMap – от id_map, IVF – от списъците, иначе 0..ntotal-1)
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.vector_to_array(index.id_map).astype("int64")
+    if isinstance(index, faiss.IndexIVF):
+        invlists = index.invlists
+        parts = [
+            faiss.rev_swig_ptr(invlists.get_ids(l), invlists.list_size(l)).copy()
+            for l in range(index.nlist) if invlists.list_size(l)
+        ]
+        return np.sort(np.concatenate(parts)).astype("int64") if parts else np.empty(0, dtype="int64")
+    return np.arange(index.ntotal, dtype="int64")
+
+
+def ensure_id_map(index):
+    """
+    Стар индекс, в който id-то е просто пореден номер, се преобразува така,
+    че да пази собствени id-та – иначе изтриването на един файл би разместило всички след него.
+    """
+    if has_own_ids(index):
+        return index
+    inner = _unwrap(index)
+    if isinstance(inner, faiss.IndexIVF):
+        # Векторите остават на място – сменя се само direct map-ът
+        inner.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
+    print("🔁 Преобразуване на индекса в IndexIDMap2...")
+    ids = index_ids(index)
+    vectors = reconstruct_ids(index, ids)
+    return build_index(vectors, index_type_of(index), ids=ids)
+
+
+def remove_ids(index, ids):
+    """
+    Маха векторите с дадените id-та. HNSW не поддържа изтриване, затова
+    при него индексът се построява наново от останалите вектори.
+    """
+    ids = np.asarray(ids, dtype="int64")
+    if len(ids) == 0:
+        return index
+    try:
+        # IVF с hashtable direct map приема само IDSelectorArray
+        index.remove_ids(faiss.IDSelectorArray(len(ids), faiss.swig_ptr(ids)))
+        return index
+    except RuntimeError:
+        keep = np.setdiff1d(index_ids(index), ids)
+        print(f"🔁 Индексът не поддържа изтриване – построяване наново от {len(keep)} вектора...")
+        if len(keep) == 0:
+            return None
+        return build_index(reconstruct_ids(index, keep), index_type_of(index), ids=keep)
+
+
+def _unwrap(index):
+    # IndexIDMap/IndexIDMap2 и подобни обвиват истинския индекс в .index
+    index = faiss.downcast_index(index)
+    while hasattr(index, "index") and not isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def configure_search(index, nprobe=None, ef_search=None):
+    inner = _unwrap(index)
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = min(nprobe or INDEX_NPROBE, inner.nlist)
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = ef_search or INDEX_EF_SEARCH
+    return index
+
+
+def index_type_of(index):
+    inner = _unwrap(index)
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf_flat"
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def reconstruct_ids(index, ids):
+    # Векторите на конкретни id-та (за IVF е нужна direct map, създава се веднъж)
+    inner = _unwrap(index)
+    if isinstance(inner, faiss.IndexIVF) and inner.direct_map.type == faiss.DirectMap.NoMap:
+        inner.set_direct_map_type(faiss.DirectMap.Hashtable)
+    dim = index.d
+    if len(ids) == 0:
+        return np.empty((0, dim), dtype="float32")
+    return np.vstack([index.reconstruct(int(i)) for i in ids]).astype("float32")
+
+
+def selector_search_params(index, ids):
+    # Параметри за търсене само сред дадени id-та, според вида на индекса
+    selector = faiss.IDSelectorBatch(np.asarray(ids, dtype="int64"))
+    inner = _unwrap(index)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=inner.nprobe), selector
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch), selector
+    return faiss.SearchParameters(sel=selector), selector
+
+
+def reconstruct_all(index):
+    # Връща оригиналните вектори (точно само за flat/IVF-Flat/HNSW-Flat индекси), подредени по id
+    return reconstruct_ids(index, index_ids(index))
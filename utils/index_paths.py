@@ -0,0 +1,79 @@
+import os
+from utils.embedding_backends import EMBEDDING_BACKEND
+
+# 📁 Всеки embedding backend има собствен индекс, защото векторите не са съвместими.
+# OpenAI остава в embeddings/ (както досега), останалите – в embeddings/<backend>/
+# Всяко построяване се записва в versions/<версия>/, а файлът CURRENT сочи активната версия.
+# Без CURRENT (стар индекс) файловете се четат директно от embeddings/.
+EMBEDDINGS_ROOT = "embeddings"
+INDEX_FILENAME = "subtitle_index.faiss"
+MAPPING_DIRNAME = "subtitle_scenes"
+LEGACY_MAPPING_FILENAME = "subtitle_mapping.pkl"
+LEXICAL_FILENAME = "subtitle_lexical.npz"
+FILE_MANIFEST_FILENAME = "subtitle_files.json"
+CATALOG_FILENAME = "movie_catalog.json"
+VERSIONS_DIRNAME = "versions"
+CURRENT_FILENAME = "CURRENT"
+
+
+def index_dir(backend=None):
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "openai":
+        return EMBEDDINGS_ROOT
+    return os.path.join(EMBEDDINGS_ROOT, backend)
+
+
+def versions_dir(backend=None):
+    return os.path.join(index_dir(backend), VERSIONS_DIRNAME)
+
+
+def version_dir(version, backend=None):
+    return os.path.join(versions_dir(backend), version)
+
+
+def current_pointer_path(backend=None):
+    return os.path.join(index_dir(backend), CURRENT_FILENAME)
+
+
+def current_version(backend=None):
+    try:
+        with open(current_pointer_path(backend), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def active_dir(backend=None):
+    # Папката на активната версия (или старата плоска папка, ако още няма версии)
+    version = current_version(backend)
+    return version_dir(version, backend) if version else index_dir(backend)
+
+
+def index_path(backend=None, base=None):
+    return os.path.join(base or active_dir(backend), INDEX_FILENAME)
+
+
+def mapping_path(backend=None, base=None):
+    return os.path.join(base or active_dir(backend), MAPPING_DIRNAME)
+
+
+def legacy_mapping_path(backend=None):
+    return os.path.join(index_dir(backend), LEGACY_MAPPING_FILENAME)
+
+
+def unversioned_mapping_path(backend=None):
+    # Индекс без версии: колонният mapping, а ако още не е конвертиран – старият pickle
+    path = mapping_path(base=index_dir(backend))
+    return path if os.path.exists(path) else legacy_mapping_path(backend)
+
+
+def lexical_path(backend=None, base=None):
+    return os.path.join(base or active_dir(backend), LEXICAL_FILENAME)
+
+
+def file_manifest_path(backend=None, base=None):
+    return os.path.join(base or active_dir(backend), FILE_MANIFEST_FILENAME)
+
+
+def catalog_path(backend=None, base=None):
+    return os.path.join(base or active_dir(backend), CATALOG_FILENAME)
@@ -0,0 +1,131 @@
+import os
+import threading
+
+from utils.subtitle_matcher import load_index_and_mapping, build_movie_timelines, MovieSubIndexes
+from utils.index_factory import configure_search
+from utils.lexical_index import load_or_build_lexical_index
+from utils.movie_catalog import load_or_build_catalog
+from utils.index_paths import (
+    index_dir, version_dir, current_version, index_path, mapping_path, unversioned_mapping_path, lexical_path,
+    catalog_path,
+)
+
+
+class LoadedSubtitleIndex:
+    """
+    Една заредена двойка FAISS индекс + mapping (с timeline по филм). Не се променя
+    след създаване – при нова версия на файловете се създава нов обект и се подменя изцяло.
+    """
+
+    def __init__(self, version, index, mapping, lexical=None, catalog_file=None):
+        self.version = version
+        self.index = index
+        self.mapping = mapping
+        self.timelines = build_movie_timelines(mapping)
+        self.movie_indexes = MovieSubIndexes(index, self.timelines)
+        self.lexical = lexical
+        # 🎬 Каталогът се пише при индексиране; за стари версии се строи от timeline-ите
+        self.catalog = load_or_build_catalog(catalog_file, self.timelines)
+
+
+class SubtitleIndexStore:
+    """
+    Държи индекса на субтитрите зареден в паметта на процеса.
+    Всяка заявка взима текущия snapshot; ако CURRENT сочи нова версия
+    (напр. след /sync или rollback), тя се зарежда и подменя атомарно.
+    Публикуваните версии не се променят, затова двойката индекс + mapping
+    винаги е съвместима. Без версии (стар индекс) се следят самите файлове.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._current = None
+        self._failed_version = None
+
+    def _disk_version(self):
+        version = current_version(self.backend)
+        if version is not None:
+            return version
+        stats = []
+        for path in self._paths(None)[:2]:
+            st = os.stat(path)
+            stats.append((st.st_mtime_ns, st.st_size, st.st_ino))
+        return tuple(stats)
+
+    def _paths(self, version):
+        if isinstance(version, str):
+            base = version_dir(version, self.backend)
+            scenes = mapping_path(base=base)
+        else:
+            # Стар деплой: subtitle_index.faiss + subtitle_mapping.pkl, докато не се пусне generate_index.py
+            base = index_dir(self.backend)
+            scenes = unversioned_mapping_path(self.backend)
+        return index_path(base=base), scenes, lexical_path(base=base), catalog_path(base=base)
+
+    def get(self):
+        current = self._current
+        try:
+            version = self._disk_version()
+        except FileNotFoundError:
+            if current is not None:
+                # Файловете се подменят в момента – продължаваме със старата версия
+                return current
+            raise
+
+        if current is not None and version in (current.version, self._failed_version):
+            return current
+
+        with self._lock:
+            # Друга нишка може вече да е заредила същата версия
+            current = self._current
+            if current is not None and current.version == version:
+                return current
+            return self._load(version, current)
+
+    def reload(self):
+        with self._lock:
+            return self._load(self._disk_version(), self._current)
+
+    def _load(self, version, previous):
+        index_file, mapping_file, lexical_file, catalog_file = self._paths(version)
+        try:
+            index, mapping = load_index_and_mapping(index_file, mapping_file)
+            configure_search(index)  # nprobe / efSearch от .env имат предимство пред записаните
+        except Exception as e:
+            if previous is None:
+                raise
+            # Повредена версия не се опитва отново при всяка заявка – само при reload()
+            self._failed_version = version
+            print(f"[INDEX] ⚠️ Неуспешно презареждане ({e}) – остава предишната версия.")
+            return previous
+
+        # Стар индекс без версии: ако файловете са се сменили докато сме чели, двойката може да е несъвместима
+        torn = False
+        if not isinstance(version, str):
+            try:
+                torn = self._disk_version() != version
+            except FileNotFoundError:
+                torn = True  # файловете се подменят точно сега
+        if torn and previous is not None:
+            # Ще се опита пак при следващата заявка, когато записът приключи
+            print("[INDEX] ⚠️ Файловете се променят в момента – остава предишната версия.")
+            return previous
+        if index.ntotal != len(mapping):
+            if previous is not None:
+                # Несъответствието е в самите файлове – не ги презареждаме при всяка заявка, само при reload()
+                self._failed_version = version
+                print(f"[INDEX] ⚠️ Индексът ({index.ntotal}) и mapping-ът ({len(mapping)}) не съвпадат – остава предишната версия.")
+                return previous
+            print("[INDEX] ⚠️ Индексът и mapping-ът може да са несъвместими.")
+        elif torn:
+            print("[INDEX] ⚠️ Индексът и mapping-ът може да са несъвместими.")
+
+        # BM25 индексът се пише заедно с FAISS файла; ако липсва – строим го в паметта
+        lexical = load_or_build_lexical_index(lexical_file, mapping)
+
+        loaded = LoadedSubtitleIndex(version, index, mapping, lexical, catalog_file)
+        self._current = loaded
+        label = f"версия {version}" if isinstance(version, str) else "индекс без версия"
+        print(f"[INDEX] 🔁 Зареден индекс ({label}): {index.ntotal} вектора и {len(mapping)} сцени.")
+        return loaded
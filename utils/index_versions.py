@@ -0,0 +1,166 @@
+import os
+import json
+import shutil
+import hashlib
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from utils.index_paths import versions_dir, version_dir, current_pointer_path, current_version
+
+load_dotenv()
+
+# 🗃️ Версии на индекса: всяко построяване се пише в нова папка, получава manifest.json
+# с контролни суми и се публикува чрез атомарна подмяна на файла CURRENT.
+# Работещите процеси виждат новата версия при следващата заявка.
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "5"))
+
+VERSION_MANIFEST_FILENAME = "manifest.json"
+STAGING_PREFIX = ".staging-"
+
+
+def new_version_id():
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _checksums(root):
+    files = {}
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            relative = os.path.relpath(path, root).replace(os.sep, "/")
+            if relative == VERSION_MANIFEST_FILENAME:
+                continue
+            files[relative] = {"size": os.path.getsize(path), "sha256": _file_sha256(path)}
+    return dict(sorted(files.items()))
+
+
+def _fsync_dir(path):
+    # Без fsync на папката преименуването може да се загуби при срив на машината
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def stage_version(backend=None):
+    """
+    Създава празна временна папка за нова версия.
+    Връща (version, path) – файловете се пишат в path, после се вика publish_version.
+    """
+    version = new_version_id()
+    path = os.path.join(versions_dir(backend), f"{STAGING_PREFIX}{version}")
+    os.makedirs(path)
+    return version, path
+
+
+def publish_version(version, staging_path, backend=None, info=None):
+    # Manifest → преименуване на папката → подмяна на CURRENT; до последната стъпка нищо не се вижда
+    manifest = {
+        "version": version,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "previous": current_version(backend),
+        "info": info or {},
+        "files": _checksums(staging_path),
+    }
+    with open(os.path.join(staging_path, VERSION_MANIFEST_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    final_path = version_dir(version, backend)
+    os.rename(staging_path, final_path)
+    _fsync_dir(versions_dir(backend))
+    set_current(version, backend)
+    print(f"[VERSIONS] 🚀 Публикувана версия {version}")
+
+    prune_versions(backend=backend)
+    return final_path
+
+
+def read_version_manifest(version, backend=None):
+    with open(os.path.join(version_dir(version, backend), VERSION_MANIFEST_FILENAME), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def set_current(version, backend=None):
+    if not os.path.exists(os.path.join(version_dir(version, backend), VERSION_MANIFEST_FILENAME)):
+        raise ValueError(f"❌ Няма публикувана версия {version}")
+    pointer = current_pointer_path(backend)
+    tmp_path = f"{pointer}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, pointer)
+    _fsync_dir(os.path.dirname(pointer) or ".")
+
+
+def list_versions(backend=None):
+    root = versions_dir(backend)
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name for name in os.listdir(root)
+        if not name.startswith(STAGING_PREFIX)
+        and os.path.exists(os.path.join(root, name, VERSION_MANIFEST_FILENAME))
+    )
+
+
+def verify_version(version, backend=None):
+    # Връща списък с проблеми; празен списък = всички файлове отговарят на manifest-а
+    manifest = read_version_manifest(version, backend)
+    root = version_dir(version, backend)
+    problems = []
+    for relative, expected in manifest["files"].items():
+        path = os.path.join(root, relative)
+        if not os.path.exists(path):
+            problems.append(f"липсва {relative}")
+        elif os.path.getsize(path) != expected["size"] or _file_sha256(path) != expected["sha256"]:
+            problems.append(f"различна контролна сума: {relative}")
+    return problems
+
+
+def rollback(version=None, backend=None):
+    """
+    Връща CURRENT към дадена версия (по подразбиране – предишната на активната).
+    Версията се проверява преди подмяната.
+    """
+    if version is None:
+        active = current_version(backend)
+        if active is None:
+            raise ValueError("❌ Няма активна версия")
+        version = read_version_manifest(active, backend).get("previous")
+        if not version:
+            raise ValueError(f"❌ Версия {active} няма предишна")
+
+    problems = verify_version(version, backend)
+    if problems:
+        raise ValueError(f"❌ Версия {version} е повредена: {'; '.join(problems)}")
+    set_current(version, backend)
+    print(f"[VERSIONS] ⏪ Активна версия: {version}")
+    return version
+
+
+def prune_versions(keep=INDEX_KEEP_VERSIONS, backend=None):
+    # Трие най-старите версии над лимита; активната и нейната предишна винаги остават
+    versions = list_versions(backend)
+    active = current_version(backend)
+    protected = {active}
+    if active:
+        protected.add(read_version_manifest(active, backend).get("previous"))
+
+    removable = [v for v in versions if v not in protected]
+    excess = len(versions) - keep
+    for version in removable[:max(excess, 0)]:
+        shutil.rmtree(version_dir(version, backend), ignore_errors=True)
+        print(f"[VERSIONS] 🗑️ Изтрита стара версия {version}")
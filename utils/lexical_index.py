@@ -0,0 +1,181 @@
+import os
+import re
+import numpy as np
+
+# 🔤 BM25 индекс върху репликите (lines) от mapping-а.
+# Почти дословните цитати се намират без embedding, а за останалите
+# лексикалните попадения се добавят като гласове към векторните резултати.
+LEXICAL_FORMAT = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_TOKEN_RE = re.compile(r"[^\W_]+(?:'[^\W_]+)*")
+
+
+def tokenize(text):
+    text = _TAG_RE.sub(" ", text).casefold().replace("’", "'")
+    return _TOKEN_RE.findall(text)
+
+
+class LexicalIndex:
+    def __init__(self, vocab, offsets, postings_rows, postings_tf, doc_lens, scene_ids):
+        self.vocab = {term: i for i, term in enumerate(vocab)}
+        self.offsets = offsets
+        self.postings_rows = postings_rows
+        self.postings_tf = postings_tf
+        self.doc_lens = doc_lens
+        self.scene_ids = scene_ids
+        self.avgdl = float(doc_lens.mean()) if len(doc_lens) else 0.0
+        doc_freq = np.diff(offsets)
+        count = len(doc_lens)
+        self.idf = np.log(1.0 + (count - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    @classmethod
+    def build(cls, mapping):
+        scene_ids = sorted(int(i) for i in mapping.keys())
+        postings = {}
+        doc_lens = np.zeros(len(scene_ids), dtype=np.int32)
+
+        for row, scene_id in enumerate(scene_ids):
+            tokens = tokenize(mapping[scene_id]["lines"])
+            doc_lens[row] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                postings.setdefault(token, []).append((row, tf))
+
+        vocab = sorted(postings)
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        rows, tfs = [], []
+        for i, term in enumerate(vocab):
+            entries = postings[term]
+            offsets[i + 1] = offsets[i] + len(entries)
+            rows.extend(row for row, _ in entries)
+            tfs.extend(tf for _, tf in entries)
+
+        return cls(
+            vocab, offsets, np.array(rows, dtype=np.int32), np.array(tfs, dtype=np.int32),
+            doc_lens, np.array(scene_ids, dtype=np.int64),
+        )
+
+    def save(self, path):
+        vocab = sorted(self.vocab, key=self.vocab.get)
+        tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+        np.savez(
+            tmp_path,
+            format=np.array(LEXICAL_FORMAT),
+            vocab=np.array(vocab, dtype=str),
+            offsets=self.offsets,
+            postings_rows=self.postings_rows,
+            postings_tf=self.postings_tf,
+            doc_lens=self.doc_lens,
+            scene_ids=self.scene_ids,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data["format"]) != LEXICAL_FORMAT:
+                raise ValueError(f"❌ Неподдържан формат на лексикалния индекс: {int(data['format'])}")
+            return cls(
+                data["vocab"].tolist(), data["offsets"], data["postings_rows"],
+                data["postings_tf"], data["doc_lens"], data["scene_ids"],
+            )
+
+    def matches_mapping(self, mapping):
+        if len(self.scene_ids) != len(mapping):
+            return False
+        return len(self.scene_ids) == 0 or (
+            int(self.scene_ids[0]) in mapping and int(self.scene_ids[-1]) in mapping
+        )
+
+    def _term_ids(self, tokens):
+        return [self.vocab[t] for t in dict.fromkeys(tokens) if t in self.vocab]
+
+    def _postings(self, term_id):
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        return self.postings_rows[start:end], self.postings_tf[start:end]
+
+    def search(self, text, top_k=10):
+        """
+        BM25 търсене. Връща (scene_ids, coverage) – coverage е делът от idf
+        теглото на заявката, който сцената съдържа (1.0 = всички думи присъстват).
+        """
+        tokens = tokenize(text)
+        term_ids = self._term_ids(tokens)
+        if not term_ids or len(self.doc_lens) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        scores = np.zeros(len(self.doc_lens), dtype=np.float32)
+        matched_idf = np.zeros(len(self.doc_lens), dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lens / max(self.avgdl, 1e-9))
+
+        for term_id in term_ids:
+            rows, tf = self._postings(term_id)
+            idf = self.idf[term_id]
+            scores[rows] += idf * tf * (BM25_K1 + 1) / (tf + norm[rows])
+            matched_idf[rows] += idf
+
+        # Непознатите думи също влизат в знаменателя на coverage
+        unknown = len(set(tokens)) - len(term_ids)
+        total_idf = float(self.idf[term_ids].sum()) + unknown * float(self.idf.max(initial=0.0))
+
+        top_k = min(top_k, int((scores > 0).sum()))
+        if top_k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        coverage = matched_idf[top] / max(total_idf, 1e-9)
+        return self.scene_ids[top], coverage.astype(np.float32)
+
+    def exact_matches(self, text, mapping, min_tokens=5, min_coverage=0.9):
+        """
+        Сцени, които съдържат цитата дословно (след нормализация) или почти
+        дословно – поне min_coverage от думите. Не изисква embedding.
+        """
+        tokens = tokenize(text)
+        if len(tokens) < min_tokens:
+            return []
+        term_ids = self._term_ids(tokens)
+        if len(term_ids) < len(set(tokens)) * min_coverage:
+            return []
+
+        # Кандидати: сечение на списъците на най-редките думи
+        term_ids.sort(key=lambda t: self.offsets[t + 1] - self.offsets[t])
+        candidates = None
+        for term_id in term_ids[:3]:
+            rows = self._postings(term_id)[0]
+            candidates = rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+            if len(candidates) == 0:
+                return []
+
+        query = " " + " ".join(tokens) + " "
+        query_set = set(tokens)
+        hits = []
+        for row in candidates[:200]:
+            scene_id = int(self.scene_ids[row])
+            scene_tokens = tokenize(mapping[scene_id]["lines"])
+            if query in " " + " ".join(scene_tokens) + " ":
+                hits.append((scene_id, 1.0))
+                continue
+            coverage = len(query_set & set(scene_tokens)) / len(query_set)
+            if coverage >= min_coverage:
+                hits.append((scene_id, coverage))
+
+        hits.sort(key=lambda h: -h[1])
+        return hits
+
+
+def load_or_build_lexical_index(path, mapping):
+    if os.path.exists(path):
+        try:
+            lexical = LexicalIndex.load(path)
+            if lexical.matches_mapping(mapping):
+                return lexical
+            print("[LEXICAL] ⚠️ Лексикалният индекс не съответства на mapping-а – строим нов в паметта.")
+        except Exception as e:
+            print(f"[LEXICAL] ⚠️ Неуспешно зареждане ({e}) – строим нов в паметта.")
+    return LexicalIndex.build(mapping)
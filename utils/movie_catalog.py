@@ -0,0 +1,156 @@
+import os
+import re
+import json
+import hashlib
+
+from utils.scene_store import ms_to_timestamp
+from utils.file_manifest import ids_to_ranges
+
+# 🎬 Каталог на филмите в индекса – по един ред на филм, изчислен при индексиране:
+#   {"id", "movie", "title", "duration_ms", "scene_count", "id_ranges", "file", "file_hash", "segmentation",
+#    "aliases"}
+# "movie" е ключът от mapping-а (името на .srt файла), "title" е за показване.
+# "aliases" са почти еднаквите файлове, които не са индексирани отделно (utils/near_duplicates.py).
+CATALOG_FORMAT = 1
+
+_TITLE_SEPARATORS_RE = re.compile(r"[_.]+")
+
+
+def display_title(movie):
+    # "The.Imitation.Game" → "The Imitation Game", "Inception_2010." → "Inception 2010"
+    return " ".join(_TITLE_SEPARATORS_RE.sub(" ", movie).split()) or movie
+
+
+class MovieCatalog:
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=lambda row: row["id"])
+        self._by_movie = {row["movie"]: row for row in self.rows}
+        self._by_id = {row["id"]: row for row in self.rows}
+        # Търсене без значение от главни/малки букви – и по ключ, и по заглавие
+        self._by_folded = {}
+        for row in self.rows:
+            self._by_folded.setdefault(row["movie"].casefold(), row)
+            self._by_folded.setdefault(row["title"].casefold(), row)
+        # Псевдонимите водят към каноничния филм – след ключовете и заглавията на истинските филми
+        self._aliases = {}
+        for row in self.rows:
+            for alias in row.get("aliases", []):
+                self._aliases.setdefault(alias, row)
+                self._by_folded.setdefault(alias.casefold(), row)
+                self._by_folded.setdefault(display_title(alias).casefold(), row)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, movie):
+        return movie in self._by_movie
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def get(self, movie):
+        return self._by_movie.get(movie)
+
+    def by_id(self, movie_id):
+        return self._by_id.get(movie_id)
+
+    def resolve(self, name):
+        # Ключ на филма по ключ, заглавие, псевдоним или различно изписване; None, ако го няма
+        if name in self._by_movie:
+            return name
+        if name in self._aliases:
+            return self._aliases[name]["movie"]
+        row = self._by_folded.get(" ".join(str(name).split()).casefold())
+        return row["movie"] if row is not None else None
+
+    def duration(self, movie):
+        row = self._by_movie.get(movie)
+        if row is None:
+            return None
+        return ms_to_timestamp(row["duration_ms"])
+
+    def to_dict(self):
+        return {"format": CATALOG_FORMAT, "movies": self.rows}
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format") != CATALOG_FORMAT:
+            raise ValueError(f"❌ Неподдържан формат на каталога: {data.get('format')}")
+        return cls(data["movies"])
+
+
+def build_catalog(timelines, manifest=None, previous=None):
+    """
+    Редовете се смятат от timeline-ите (брой сцени, последна сцена) и манифеста на
+    файловете (файл, hash, id-та, край на последната реплика). Id-тата на филмите
+    от предишния каталог се запазват, новите филми получават следващите.
+    """
+    files_by_movie = {}
+    aliases = {}
+    if manifest is not None:
+        for filename, entry in manifest["files"].items():
+            if entry.get("alias_of"):
+                aliases.setdefault(entry["alias_of"], []).append(entry["movie"])
+            else:
+                files_by_movie[entry["movie"]] = (filename, entry)
+
+    previous_ids = {row["movie"]: row["id"] for row in previous} if previous is not None else {}
+    next_id = max(previous_ids.values(), default=-1) + 1
+
+    rows = []
+    for movie in sorted(timelines):
+        timeline = timelines[movie]
+        filename, entry = files_by_movie.get(movie, (None, {}))
+        last_start_ms = timeline.starts_ms[-1] if timeline.starts_ms else 0
+
+        movie_id = previous_ids.get(movie)
+        if movie_id is None:
+            movie_id, next_id = next_id, next_id + 1
+
+        id_ranges = entry.get("ranges")
+        if id_ranges is None:
+            id_ranges = ids_to_ranges(timeline.scene_ids)
+
+        rows.append({
+            "id": movie_id,
+            "movie": movie,
+            "title": display_title(movie),
+            # Краят на последната реплика, ако файлът е парснат с новия парсер; иначе началото на последната сцена
+            "duration_ms": max(entry.get("duration_ms") or 0, int(last_start_ms)),
+            "scene_count": len(timeline.scene_ids),
+            "id_ranges": id_ranges,
+            "file": filename,
+            "file_hash": entry.get("hash"),
+            "segmentation": manifest.get("segmentation") if manifest is not None else None,
+            "aliases": sorted(aliases.get(movie, [])),
+        })
+    return MovieCatalog(rows)
+
+
+def summary_key(row):
+    """
+    Ключ на съдържанието на сцените за кеша на обобщенията: hash на файла + сегментацията.
+    Със същия .srt, но друга сегментация, "Сцена 5" е друг текст. None, ако някое от двете липсва.
+    """
+    if not row or not row.get("file_hash") or not row.get("segmentation"):
+        return None
+    segmentation = json.dumps(row["segmentation"], sort_keys=True)
+    return hashlib.sha256(f"{row['file_hash']}|{segmentation}".encode("utf-8")).hexdigest()
+
+
+def load_or_build_catalog(path, timelines):
+    if path and os.path.exists(path):
+        try:
+            return MovieCatalog.load(path)
+        except Exception as e:
+            print(f"[CATALOG] ⚠️ Неуспешно зареждане ({e}) – строим каталога в паметта.")
+    return build_catalog(timelines)
+
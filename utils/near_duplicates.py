@@ -0,0 +1,85 @@
+import os
+import re
+import hashlib
+
+import numpy as np
+from dotenv import load_dotenv
+
+from utils.subtitle_parser import iter_cues
+
+load_dotenv()
+
+# 👯 Почти еднакви субтитри (друго издание/име на същия филм, напр. Whiplash.srt и Whiplash_2015.srt):
+# MinHash подпис от словни шинглите на целия текст. Файл, който прилича достатъчно на вече
+# индексиран, става псевдоним на него – не се embed-ва и не влиза в индекса втори път.
+SUBTITLE_DUPLICATE_THRESHOLD = float(os.getenv("SUBTITLE_DUPLICATE_THRESHOLD", "0.7"))  # 0 → изключено
+SUBTITLE_SHINGLE_WORDS = int(os.getenv("SUBTITLE_SHINGLE_WORDS", "5"))
+MINHASH_PERMUTATIONS = 128
+
+_WORD_RE = re.compile(r"\w+")
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+# Фиксирани пермутации – подписите от различни пускания трябва да са сравними
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, 1 << 32, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 32, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def shingles(words, size=SUBTITLE_SHINGLE_WORDS):
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _shingle_hashes(shingle_set):
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingle_set),
+        dtype=np.uint64, count=len(shingle_set),
+    )
+
+
+def minhash(shingle_set):
+    # Минимумът на всяка от пермутациите (a·x + b) mod 2³²; празен текст → None
+    if not shingle_set:
+        return None
+    hashes = _shingle_hashes(shingle_set)
+    permuted = (np.outer(hashes, _A) + _B) & _MAX_HASH
+    return permuted.min(axis=0).astype(np.uint32).tolist()
+
+
+def file_signature(file_path):
+    # Думите на всички реплики подред – без значение как са разделени на реплики и сцени
+    words = []
+    for cue in iter_cues(file_path):
+        words.extend(_WORD_RE.findall(cue["text"].lower()))
+    return minhash(shingles(words))
+
+
+def similarity(signature_a, signature_b):
+    # Дял на еднаквите минимуми ≈ Jaccard сходство на шинглите
+    if not signature_a or not signature_b or len(signature_a) != len(signature_b):
+        return 0.0
+    return float(np.mean(np.asarray(signature_a) == np.asarray(signature_b)))
+
+
+def find_duplicates(candidates, known, threshold=SUBTITLE_DUPLICATE_THRESHOLD):
+    """
+    candidates: {movie: подпис} за новите файлове; known: {movie: подпис} за вече индексираните.
+    Кандидатите се обхождат подред – първият от група еднакви остава, а следващите
+    стават негови псевдоними. Връща {movie: (каноничен филм, сходство)}.
+    """
+    if threshold <= 0:
+        return {}
+    canonical = {movie: signature for movie, signature in known.items() if signature}
+    aliases = {}
+    for movie, signature in candidates.items():
+        best, best_score = None, 0.0
+        for other, other_signature in canonical.items():
+            score = similarity(signature, other_signature)
+            if score > best_score:
+                best, best_score = other, score
+        if best is not None and best_score >= threshold:
+            aliases[movie] = (best, best_score)
+        elif signature:
+            canonical[movie] = signature
+    return aliases
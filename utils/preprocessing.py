@@ -1,57 +1,92 @@
 import os
-import pickle
 import faiss
 import numpy as np
-from langchain.embeddings import OpenAIEmbeddings
 from dotenv import load_dotenv
-from utils.subtitle_parser import parse_srt_file
+from utils.subtitle_parser import parse_directory
+from utils.segmentation import segmentation_config
+from utils.near_duplicates import file_signature, find_duplicates
+from utils.scene_store import write_scene_store
+from utils.lexical_index import LexicalIndex
+from utils.index_factory import build_index
+from utils.embedding_backends import get_backend
+from utils.embedding_pipeline import embed_texts
+from utils.file_manifest import bootstrap_manifest, file_sha256, save_manifest
+from utils.movie_catalog import build_catalog
+from utils.subtitle_matcher import build_movie_timelines
+from utils.index_paths import index_path, mapping_path, lexical_path, file_manifest_path, catalog_path
+from utils.index_versions import stage_version, publish_version
+from firebase_utils import current_sync_seq
 
 load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 
 SUBTITLES_DIR = "subtitles"
 
 
-INDEX_PATH = "embeddings/subtitle_index.faiss"
-MAPPING_PATH = "embeddings/subtitle_mapping.pkl"
+def main(backend=None):
+    # backend: "openai" / "local" или None → EMBEDDING_BACKEND от .env
+    embedder = get_backend(backend)
 
-def main():
-    embedder = OpenAIEmbeddings(api_key=OPENAI_API_KEY)
-
-    all_embeddings = []
     mapping = {}
+    durations = {}
     idx = 0
 
-    for file_name in os.listdir(SUBTITLES_DIR):
-        if not file_name.endswith(".srt"):
-            continue
-        movie_name = file_name.replace(".srt", "")
-        file_path = os.path.join(SUBTITLES_DIR, file_name)
-        subtitles = parse_srt_file(file_path)
+    # Същата сегментация като в generate_index.py (SUBTITLE_SEGMENTATION от .env)
+    segmentation = segmentation_config()
+    sync_seq = current_sync_seq()  # преди четенето – всичко след него е за следващото индексиране
+    parsed = parse_directory(SUBTITLES_DIR, segmentation)
+
+    # 👯 Почти еднаквите файлове стават псевдоними на първия от групата и не се индексират
+    signatures = {file_name: file_signature(os.path.join(SUBTITLES_DIR, file_name)) for file_name in parsed}
+    aliases = find_duplicates({file_name[:-len(".srt")]: signature for file_name, signature in signatures.items()}, {})
 
-        for block in subtitles:
-            text = block["text"]
-            timestamp = block["timestamp"]
-            vector = embedder.embed_query(text)
-            all_embeddings.append(vector)
+    for file_name, scenes in parsed.items():
+        movie_name = file_name[:-len(".srt")]
+        if movie_name in aliases:
+            continue
+        durations[file_name] = max((scene["end_ms"] for scene in scenes), default=0)
 
+        for scene in scenes:
             mapping[idx] = {
-                "lines": text,
-                "timestamp": timestamp,
+                "lines": scene["text"],
+                "timestamp": scene["timestamp"],
                 "movie": movie_name
             }
             idx += 1
 
 
-    dim = len(all_embeddings[0])
-    index = faiss.IndexFlatL2(dim)
-    index.add(np.array(all_embeddings).astype("float32"))
-
-
-    faiss.write_index(index, INDEX_PATH)
-    with open(MAPPING_PATH, "wb") as f:
-        pickle.dump(mapping, f)
+    # 🚚 Embedding на партиди, няколко паралелно (EMBED_BATCH_SIZE / EMBED_WORKERS)
+    all_embeddings = embed_texts(embedder, [entry["lines"] for entry in mapping.values()])
+    index = build_index(all_embeddings)
+
+
+    # 🗃️ Нова версия – сървърът я вижда едва след publish_version
+    version, staging = stage_version(embedder.name)
+    faiss.write_index(index, index_path(base=staging))
+    write_scene_store(mapping_path(base=staging), mapping)
+    LexicalIndex.build(mapping).save(lexical_path(base=staging))
+    # 🧾 Манифест на файловете, за да може generate_index.py да продължи инкрементално
+    manifest = bootstrap_manifest(mapping, SUBTITLES_DIR)
+    manifest["segmentation"] = segmentation
+    manifest["firebase_sync_seq"] = sync_seq
+    for file_name, entry in manifest["files"].items():
+        entry["duration_ms"] = durations.get(file_name, 0)
+        entry["minhash"] = signatures.get(file_name)
+    for movie_name, (canonical, score) in aliases.items():
+        file_name = movie_name + ".srt"
+        manifest["files"][file_name] = {
+            "hash": file_sha256(os.path.join(SUBTITLES_DIR, file_name)),
+            "movie": movie_name,
+            "ranges": [],
+            "alias_of": canonical,
+            "similarity": round(score, 3),
+            "minhash": signatures[file_name],
+        }
+    save_manifest(file_manifest_path(base=staging), manifest)
+    catalog = build_catalog(build_movie_timelines(mapping), manifest)
+    catalog.save(catalog_path(base=staging))
+    publish_version(version, staging, embedder.name,
+                    info={"scenes": len(mapping), "vectors": int(index.ntotal), "movies": len(catalog)})
 
     print(" Индексът и mapping-а са успешно създадени.")
 
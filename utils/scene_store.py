@@ -0,0 +1,181 @@
+import os
+import json
+import mmap
+import pickle
+import shutil
+from collections.abc import Mapping
+
+import numpy as np
+
+# 📦 Колонен формат на mapping-а (директория):
+#   meta.json         – версия на формата, брой сцени и списък с филмите
+#   scene_ids.npy     – int64, id на сцената във FAISS (сортирани)
+#   movie_ids.npy     – int32, индекс във meta["movies"]
+#   start_ms.npy      – int64, начало на сцената в милисекунди
+#   text_offsets.npy  – int64, n + 1 отместания в text.bin
+#   text.bin          – UTF-8 текстът на всички сцени един след друг
+STORE_FORMAT = 1
+
+
+def timestamp_to_ms(t):
+    # Приема "HH:MM:SS", "HH:MM:SS,mmm" и "HH:MM:SS.ffffff" → цели милисекунди
+    t = t.strip().replace(",", ".")
+    hms, _, frac = t.partition(".")
+    h, m, s = hms.split(":")
+    ms = int((frac + "000")[:3]) if frac else 0
+    return (int(h) * 3600 + int(m) * 60 + int(s)) * 1000 + ms
+
+
+def ms_to_timestamp(ms):
+    # Същият вид като str(datetime.time), който се пазеше в стария pickle mapping
+    ms = int(ms)
+    seconds, millis = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    base = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+    return f"{base}.{millis * 1000:06d}" if millis else base
+
+
+class SceneStore(Mapping):
+    """
+    Read-only mapping scene_id → {"lines", "timestamp", "movie"} върху mmap-нати файлове.
+    Масивите не се копират в паметта на процеса, така че всички gunicorn worker-и
+    споделят едни и същи страници от page cache-а.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != STORE_FORMAT:
+            raise ValueError(f"❌ Неподдържан формат на mapping-а: {meta.get('format')}")
+
+        self.path = path
+        self.movies = meta["movies"]
+        self.scene_ids = np.load(os.path.join(path, "scene_ids.npy"), mmap_mode="r")
+        self.movie_ids = np.load(os.path.join(path, "movie_ids.npy"), mmap_mode="r")
+        self.start_ms = np.load(os.path.join(path, "start_ms.npy"), mmap_mode="r")
+        self.text_offsets = np.load(os.path.join(path, "text_offsets.npy"), mmap_mode="r")
+
+        text_path = os.path.join(path, "text.bin")
+        if os.path.getsize(text_path) > 0:
+            with open(text_path, "rb") as f:
+                self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._text = b""
+
+        count = len(self.scene_ids)
+        # Обикновено id-тата са 0..n-1 и редът съвпада с id-то
+        self._contiguous = count == 0 or (self.scene_ids[0] == 0 and self.scene_ids[-1] == count - 1)
+
+    def row_of(self, scene_id):
+        count = len(self.scene_ids)
+        if self._contiguous:
+            row = int(scene_id)
+            if 0 <= row < count:
+                return row
+            raise KeyError(scene_id)
+        row = int(np.searchsorted(self.scene_ids, scene_id))
+        if row < count and self.scene_ids[row] == scene_id:
+            return row
+        raise KeyError(scene_id)
+
+    def rows_of(self, scene_ids):
+        # Векторизиран вариант на row_of за масив от id-та
+        scene_ids = np.asarray(scene_ids, dtype=np.int64)
+        if self._contiguous:
+            rows = scene_ids
+        else:
+            rows = np.searchsorted(self.scene_ids, scene_ids)
+        count = len(self.scene_ids)
+        if len(rows) and (rows.min() < 0 or rows.max() >= count
+                          or not np.array_equal(np.asarray(self.scene_ids)[rows], scene_ids)):
+            raise KeyError("❌ Някои id-та липсват в mapping-а")
+        return rows
+
+    def lines_at(self, row):
+        start, end = self.text_offsets[row], self.text_offsets[row + 1]
+        return self._text[start:end].decode("utf-8")
+
+    def movie_at(self, row):
+        return self.movies[self.movie_ids[row]]
+
+    def __getitem__(self, scene_id):
+        row = self.row_of(scene_id)
+        return {
+            "lines": self.lines_at(row),
+            "timestamp": ms_to_timestamp(self.start_ms[row]),
+            "movie": self.movie_at(row),
+        }
+
+    def __iter__(self):
+        return iter(self.scene_ids.tolist())
+
+    def __len__(self):
+        return len(self.scene_ids)
+
+    def __contains__(self, scene_id):
+        try:
+            self.row_of(scene_id)
+            return True
+        except (KeyError, TypeError, ValueError):
+            return False
+
+    def movie_counts(self):
+        counts = np.bincount(self.movie_ids, minlength=len(self.movies))
+        return {movie: int(count) for movie, count in zip(self.movies, counts)}
+
+
+def write_scene_store(path, mapping):
+    """
+    Записва mapping (scene_id → dict) в колонния формат. Пише се в нова временна
+    директория, която после заменя старата, за да не се четат полузаписани файлове.
+    """
+    scene_ids = sorted(int(i) for i in mapping.keys())
+    movies = []
+    movie_index = {}
+    movie_ids = np.empty(len(scene_ids), dtype=np.int32)
+    start_ms = np.empty(len(scene_ids), dtype=np.int64)
+    text_offsets = np.zeros(len(scene_ids) + 1, dtype=np.int64)
+    chunks = []
+    offset = 0
+
+    for row, scene_id in enumerate(scene_ids):
+        entry = mapping[scene_id]
+        movie = entry["movie"]
+        if movie not in movie_index:
+            movie_index[movie] = len(movies)
+            movies.append(movie)
+        movie_ids[row] = movie_index[movie]
+        start_ms[row] = timestamp_to_ms(entry["timestamp"])
+        encoded = entry["lines"].encode("utf-8")
+        chunks.append(encoded)
+        offset += len(encoded)
+        text_offsets[row + 1] = offset
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    np.save(os.path.join(tmp_path, "scene_ids.npy"), np.array(scene_ids, dtype=np.int64))
+    np.save(os.path.join(tmp_path, "movie_ids.npy"), movie_ids)
+    np.save(os.path.join(tmp_path, "start_ms.npy"), start_ms)
+    np.save(os.path.join(tmp_path, "text_offsets.npy"), text_offsets)
+    with open(os.path.join(tmp_path, "text.bin"), "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"format": STORE_FORMAT, "count": len(scene_ids), "movies": movies}, f, ensure_ascii=False)
+
+    old_path = f"{path}.old-{os.getpid()}"
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def load_mapping(path):
+    # Директория → колонен формат; файл → стар pickle mapping
+    if os.path.isdir(path):
+        return SceneStore(path)
+    with open(path, "rb") as f:
+        return pickle.load(f)
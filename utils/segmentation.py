@@ -0,0 +1,111 @@
+import os
+
+from dotenv import load_dotenv
+
+from utils.scene_store import ms_to_timestamp
+
+load_dotenv()
+
+# ✂️ Как репликите се групират в сцени (един вектор = една сцена).
+# По-едрите сцени значат по-малък индекс и по-евтин embedding, по-ситните – по-точно съвпадение.
+#   cues    – по N реплики (досегашното поведение, N = 5)
+#   time    – прозорци с фиксирана дължина във времето
+#   gap     – нова сцена при пауза между репликите (тишина), с горна граница на репликите
+#   sliding – по N реплики със застъпване, за да не се реже цитат на границата
+SUBTITLE_SEGMENTATION = os.getenv("SUBTITLE_SEGMENTATION", "cues")
+SUBTITLE_CUES_PER_SCENE = int(os.getenv("SUBTITLE_CUES_PER_SCENE", "5"))
+SUBTITLE_WINDOW_MS = int(os.getenv("SUBTITLE_WINDOW_MS", "20000"))
+SUBTITLE_GAP_MS = int(os.getenv("SUBTITLE_GAP_MS", "2500"))
+SUBTITLE_GAP_MAX_CUES = int(os.getenv("SUBTITLE_GAP_MAX_CUES", "12"))
+SUBTITLE_WINDOW_OVERLAP = int(os.getenv("SUBTITLE_WINDOW_OVERLAP", "2"))
+
+
+def make_scene(chunk):
+    start_ms = chunk[0]["start_ms"]
+    return {
+        "text": " ".join(cue["text"] for cue in chunk),
+        "start_ms": start_ms,
+        "end_ms": max(cue["end_ms"] for cue in chunk),
+        "timestamp": ms_to_timestamp(start_ms),
+    }
+
+
+def group_cues(cues, max_cues=SUBTITLE_CUES_PER_SCENE):
+    # Всеки max_cues последователни реплики са една сцена
+    chunk = []
+    for cue in cues:
+        chunk.append(cue)
+        if len(chunk) >= max_cues:
+            yield make_scene(chunk)
+            chunk = []
+    if chunk:
+        yield make_scene(chunk)
+
+
+def group_by_time(cues, window_ms=SUBTITLE_WINDOW_MS):
+    # Сцената започва с първата реплика и събира всички, започнали до window_ms след нея
+    chunk = []
+    for cue in cues:
+        if chunk and cue["start_ms"] - chunk[0]["start_ms"] >= window_ms:
+            yield make_scene(chunk)
+            chunk = []
+        chunk.append(cue)
+    if chunk:
+        yield make_scene(chunk)
+
+
+def group_by_gap(cues, gap_ms=SUBTITLE_GAP_MS, max_cues=SUBTITLE_GAP_MAX_CUES):
+    # Пауза от поне gap_ms между края на една реплика и началото на следващата – нова сцена
+    chunk = []
+    for cue in cues:
+        if chunk and (cue["start_ms"] - chunk[-1]["end_ms"] >= gap_ms or len(chunk) >= max_cues):
+            yield make_scene(chunk)
+            chunk = []
+        chunk.append(cue)
+    if chunk:
+        yield make_scene(chunk)
+
+
+def sliding_windows(cues, max_cues=SUBTITLE_CUES_PER_SCENE, overlap=SUBTITLE_WINDOW_OVERLAP):
+    """
+    Прозорци от max_cues реплики, всеки започва max_cues - overlap реплики след предишния.
+    Сцените се застъпват – подходящо за търсене на цитати, но текстът до даден момент
+    (get_scenes_up_to) съдържа застъпените реплики повече от веднъж.
+    """
+    cues = list(cues)
+    step = max(1, max_cues - overlap)
+    start = 0
+    while start < len(cues):
+        yield make_scene(cues[start:start + max_cues])
+        if start + max_cues >= len(cues):
+            break
+        start += step
+
+
+SEGMENTERS = {
+    "cues": (group_cues, {"max_cues": SUBTITLE_CUES_PER_SCENE}),
+    "time": (group_by_time, {"window_ms": SUBTITLE_WINDOW_MS}),
+    "gap": (group_by_gap, {"gap_ms": SUBTITLE_GAP_MS, "max_cues": SUBTITLE_GAP_MAX_CUES}),
+    "sliding": (sliding_windows, {"max_cues": SUBTITLE_CUES_PER_SCENE, "overlap": SUBTITLE_WINDOW_OVERLAP}),
+}
+
+
+def segmentation_config(strategy=None, **params):
+    """
+    Пълната конфигурация {"strategy", "params"} – стойностите по подразбиране от .env
+    допълнени с подадените. Записва се в манифеста, за да се види кога индексът е остарял.
+    """
+    strategy = strategy or SUBTITLE_SEGMENTATION
+    if strategy not in SEGMENTERS:
+        raise ValueError(f"❌ Непозната сегментация: {strategy} (възможни: {', '.join(SEGMENTERS)})")
+    _, defaults = SEGMENTERS[strategy]
+    unknown = set(params) - set(defaults)
+    if unknown:
+        raise ValueError(f"❌ Непознати параметри за {strategy}: {', '.join(sorted(unknown))}")
+    return {"strategy": strategy, "params": {**defaults, **params}}
+
+
+def segment(cues, strategy=None, **params):
+    config = segmentation_config(strategy, **params)
+    segmenter, _ = SEGMENTERS[config["strategy"]]
+    return segmenter(cues, **config["params"])
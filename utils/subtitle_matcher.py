@@ -1,87 +1,370 @@
 import faiss
-import pickle
 import numpy as np
-from langchain.embeddings import OpenAIEmbeddings
+from bisect import bisect_right
 from dotenv import load_dotenv
 import os
+import threading
+from collections import OrderedDict
+from utils.scene_store import SceneStore, load_mapping, timestamp_to_ms
+from utils.embedding_cache import get_default_cache
+from utils.embedding_backends import get_backend
+from utils.index_factory import reconstruct_ids, selector_search_params
 
 load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 
 class SimpleEmbedder:
-    def __init__(self):
-        if not OPENAI_API_KEY:
-            raise ValueError("❌ Липсва OPENAI_API_KEY в .env файла!")
-        self.embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
+    def __init__(self, backend=None, cache=None):
+        # backend: "openai" / "local" или None → EMBEDDING_BACKEND от .env
+        self.backend = get_backend(backend)
+        self.model_name = f"{self.backend.name}:{self.backend.model_name}"
+        self.match_threshold = self.backend.match_threshold
+        # 🧠 Повтарящите се реплики не минават отново през модела
+        self.cache = cache if cache is not None else get_default_cache()
 
     def embed_text(self, text):
         if not text or not isinstance(text, str):
             raise ValueError("❌ Не може да се създаде embedding: текстът е празен или невалиден.")
+
+        cached = self.cache.get(self.model_name, text)
+        if cached is not None:
+            return cached
+
         try:
-            return self.embeddings.embed_query(text)
+            vector = self.backend.embed_query(text)
         except Exception as e:
             print(f"[ERROR] Embedding failed: {e}")
             raise
 
+        self.cache.put(self.model_name, text, vector)
+        return vector
+
+    def embed_texts(self, texts):
+        # Кешираните текстове се вземат наготово, останалите – с една batch заявка
+        vectors = [self.cache.get(self.model_name, text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if not missing:
+            return vectors
+
+        try:
+            embedded = self.backend.embed_documents([texts[i] for i in missing])
+        except Exception as e:
+            print(f"[ERROR] Batch embedding failed: {e}")
+            raise
+
+        for i, vector in zip(missing, embedded):
+            self.cache.put(self.model_name, texts[i], vector)
+            vectors[i] = vector
+        return vectors
+
 
 def load_index_and_mapping(index_path, mapping_path):
     if not os.path.exists(index_path):
         raise FileNotFoundError(f"❌ Не е намерен FAISS индекс на пътя: {index_path}")
     if not os.path.exists(mapping_path):
-        raise FileNotFoundError(f"❌ Не е намерен pickle mapping файл на пътя: {mapping_path}")
+        raise FileNotFoundError(f"❌ Не е намерен mapping на пътя: {mapping_path}")
 
     index = faiss.read_index(index_path)
-    with open(mapping_path, "rb") as f:
-        mapping = pickle.load(f)
+    mapping = load_mapping(mapping_path)
     return index, mapping
 
 
-def find_best_match(user_text, index, mapping, embedder, top_k=1):
-    if not user_text or not isinstance(user_text, str):
-        raise ValueError("❌ Входният текст за търсене е празен или невалиден.")
+# 🗳️ Режим с много кандидати: top-k резултата, гласуване по филм и по съседни сцени
+MATCH_TOP_K = int(os.getenv("MATCH_TOP_K", "50"))
+MATCH_ADJACENCY_MS = int(os.getenv("MATCH_ADJACENCY_MS", "60000"))  # сцени на ≤ 60s се подкрепят
+MATCH_MOVIE_VOTE_WEIGHT = float(os.getenv("MATCH_MOVIE_VOTE_WEIGHT", "0.5"))
+MOVIE_SUBINDEX_CACHE_SIZE = int(os.getenv("MOVIE_SUBINDEX_CACHE_SIZE", "32"))
+
+# 🔤 Лексикално търсене (BM25) – дословни цитати без embedding и гласове към векторите
+LEXICAL_EXACT_MIN_TOKENS = int(os.getenv("LEXICAL_EXACT_MIN_TOKENS", "5"))
+LEXICAL_EXACT_MIN_COVERAGE = float(os.getenv("LEXICAL_EXACT_MIN_COVERAGE", "0.9"))
+LEXICAL_MIN_COVERAGE = float(os.getenv("LEXICAL_MIN_COVERAGE", "0.5"))
+LEXICAL_FUSION_WEIGHT = float(os.getenv("LEXICAL_FUSION_WEIGHT", "0.5"))
+
+
+class MovieSubIndexes:
+    """
+    Търсене само в избрани филми. За всеки филм се строи малък IndexFlatL2 от
+    векторите на неговите сцени (веднъж, после се пази в LRU), така че цената
+    зависи от сцените на избраните филми, а не от целия каталог. Ако индексът
+    не позволява reconstruct, търсим в големия индекс с FAISS ID selector.
+    """
+
+    def __init__(self, index, timelines, max_movies=MOVIE_SUBINDEX_CACHE_SIZE):
+        self.index = index
+        self.timelines = timelines
+        self.max_movies = max_movies
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sub_index(self, movie):
+        with self._lock:
+            if movie in self._cache:
+                self._cache.move_to_end(movie)
+                return self._cache[movie]
+
+            ids = np.array(self.timelines[movie].scene_ids, dtype=np.int64)
+            try:
+                vectors = reconstruct_ids(self.index, ids)
+                sub_index = faiss.IndexFlatL2(self.index.d)
+                sub_index.add(vectors)
+            except RuntimeError as e:
+                print(f"[⚠️] Reconstruct не се поддържа ({e}) – търсене със selector за {movie}")
+                sub_index = None
+
+            self._cache[movie] = (sub_index, ids)
+            while len(self._cache) > self.max_movies:
+                self._cache.popitem(last=False)
+            return sub_index, ids
+
+    def search(self, vectors, top_k, movies):
+        known = [movie for movie in dict.fromkeys(movies) if movie in self.timelines]
+        unknown = set(movies) - set(known)
+        if unknown:
+            print(f"[⚠️] Непознати филми във филтъра: {', '.join(sorted(unknown))}")
+
+        count = len(vectors)
+        all_distances = [np.full((count, 0), np.inf, dtype=np.float32)]
+        all_ids = [np.full((count, 0), -1, dtype=np.int64)]
+        selector_ids = []
+
+        for movie in known:
+            sub_index, ids = self._sub_index(movie)
+            if sub_index is None:
+                selector_ids.append(ids)
+                continue
+            distances, rows = sub_index.search(vectors, min(top_k, len(ids)))
+            all_distances.append(distances)
+            all_ids.append(np.where(rows >= 0, ids[np.maximum(rows, 0)], -1))
+
+        if selector_ids:
+            params, _selector = selector_search_params(self.index, np.concatenate(selector_ids))
+            distances, found = self.index.search(vectors, top_k, params=params)
+            all_distances.append(distances)
+            all_ids.append(found)
+
+        # Сливаме резултатите от всички филми и взимаме общите top_k
+        distances = np.hstack(all_distances)
+        ids = np.hstack(all_ids)
+        order = np.argsort(distances, axis=1, kind="stable")[:, :top_k]
+        distances = np.take_along_axis(distances, order, axis=1)
+        ids = np.take_along_axis(ids, order, axis=1)
+
+        if distances.shape[1] < top_k:
+            pad = top_k - distances.shape[1]
+            distances = np.pad(distances, ((0, 0), (0, pad)), constant_values=np.inf)
+            ids = np.pad(ids, ((0, 0), (0, pad)), constant_values=-1)
+        return distances, ids
+
+
+def _normalize_movies(movies, catalog=None):
+    if movies is None:
+        return None
+    if isinstance(movies, str):
+        movies = [movies]
+    if catalog is None:
+        return list(movies)
+    # Каталогът приема и заглавието ("The Imitation Game") или друго изписване на ключа
+    return [catalog.resolve(movie) or movie for movie in movies]
+
+
+def _search(index, mapping, vectors, top_k, movies, movie_indexes):
+    if movies is None:
+        return index.search(vectors, top_k)
+    if movie_indexes is None:
+        # Без готови под-индекси (напр. извън сървъра) – строим ги за тази заявка
+        movie_indexes = MovieSubIndexes(index, build_movie_timelines(mapping))
+    return movie_indexes.search(vectors, top_k, movies)
+
+
+def _text_filter_reasons(user_text):
+    words = user_text.strip().lower().split()
+    if len(words) < 5 or len(set(words)) < 4:
+        return ["твърде кратък или малко уникални думи"]
+    return []
+
+
+def _hit_columns(mapping, ids):
+    # Филм и начало (ms) за всеки резултат – директно от масивите при колонния mapping
+    if isinstance(mapping, SceneStore):
+        rows = mapping.rows_of(ids)
+        movies = [mapping.movies[m] for m in np.asarray(mapping.movie_ids)[rows]]
+        return movies, np.asarray(mapping.start_ms)[rows]
+
+    movies, starts = [], []
+    for i in ids:
+        scene = mapping[i]
+        movies.append(scene["movie"])
+        starts.append(timestamp_to_ms(scene["timestamp"]))
+    return movies, np.array(starts, dtype=np.int64)
+
+
+def rank_matches(distances, indices, mapping, dist_threshold, lexical_hits=None):
+    """
+    Групира top-k резултатите по филм и по близост във времето.
+    Съседни сцени от един филм се подкрепят взаимно, а останалите попадения
+    в същия филм дават допълнителен глас. Връща списък, подреден по confidence.
+    lexical_hits – (scene_ids, тегла) от BM25; добавят се като допълнителни гласове.
+    """
+    distances = np.asarray(distances, dtype=np.float32)
+    indices = np.asarray(indices, dtype=np.int64)
+
+    keep = (indices >= 0) & (distances <= dist_threshold)
+    ids, dists = indices[keep], distances[keep]
+
+    # Тегло 1 за точно съвпадение, 0 на прага
+    weights = 1.0 - dists / dist_threshold if dist_threshold > 0 else np.ones_like(dists)
+    weights = np.maximum(weights, 1e-6)
+
+    if lexical_hits is not None and len(lexical_hits[0]):
+        # Сцена, намерена и от двата метода, получава сбора от теглата
+        combined = dict(zip(ids.tolist(), weights.tolist()))
+        best_dist = dict(zip(ids.tolist(), dists.tolist()))
+        for scene_id, weight in zip(*lexical_hits):
+            scene_id = int(scene_id)
+            combined[scene_id] = combined.get(scene_id, 0.0) + float(weight)
+        ids = np.array(list(combined), dtype=np.int64)
+        weights = np.array(list(combined.values()), dtype=np.float32)
+        dists = np.array([best_dist.get(i, np.nan) for i in combined], dtype=np.float32)
+
+    if len(ids) == 0:
+        return []
+    movies, starts = _hit_columns(mapping, ids)
+
+    per_movie = {}
+    for pos, movie in enumerate(movies):
+        per_movie.setdefault(movie, []).append(pos)
+
+    clusters = []
+    for movie, positions in per_movie.items():
+        positions = np.array(positions)
+        positions = positions[np.argsort(starts[positions], kind="stable")]
+        movie_weight = float(weights[positions].sum())
+
+        # Нов клъстер там, където разликата между съседни попадения е над прага
+        gaps = np.diff(starts[positions]) > MATCH_ADJACENCY_MS
+        for group in np.split(positions, np.flatnonzero(gaps) + 1):
+            cluster_weight = float(weights[group].sum())
+            best = group[np.argmax(weights[group])]
+            clusters.append({
+                "movie": movie,
+                "scene_id": int(ids[best]),
+                "score": None if np.isnan(dists[best]) else float(dists[best]),
+                "hits": len(group),
+                "weight": cluster_weight + MATCH_MOVIE_VOTE_WEIGHT * (movie_weight - cluster_weight),
+            })
+
+    total = sum(c["weight"] for c in clusters)
+    results = []
+    for cluster in sorted(clusters, key=lambda c: -c["weight"]):
+        scene = mapping[cluster["scene_id"]]
+        results.append({
+            "movie": cluster["movie"],
+            "timestamp": scene["timestamp"],
+            "confidence": round(cluster["weight"] / total, 4),
+            "score": cluster["score"],
+            "hits": cluster["hits"],
+            "scene_id": cluster["scene_id"],
+            "lines": scene["lines"],
+        })
+    return results
 
-    vector = np.array([embedder.embed_text(user_text)]).astype("float32")
-    distances, indices = index.search(vector, top_k)
 
-    dist_threshold = 0.35  # 🚫 Всичко над 0.35 се отрязва
+def exact_quote_matches(user_text, mapping, lexical, movies=None):
+    """
+    Бърз път без embedding: сцени, които съдържат цитата (почти) дословно.
+    Връща резултати във формата на rank_matches или [] ако няма такива.
+    """
+    hits = lexical.exact_matches(user_text, mapping, min_tokens=LEXICAL_EXACT_MIN_TOKENS,
+                                 min_coverage=LEXICAL_EXACT_MIN_COVERAGE)
+    if movies is not None:
+        allowed = set(movies)
+        hits = [(scene_id, coverage) for scene_id, coverage in hits if mapping[scene_id]["movie"] in allowed]
+    if not hits:
+        return []
 
-    results = []
-    print("\n🔎 Започва проверка на резултатите чрез филтъра...\n")
+    ids = np.array([scene_id for scene_id, _ in hits], dtype=np.int64)
+    coverage = np.array([c for _, c in hits], dtype=np.float32)
+    results = rank_matches([], [], mapping, 1.0, lexical_hits=(ids, coverage))
+    for result in results:
+        result["source"] = "lexical"
+    return results
+
+
+def _lexical_votes(user_text, mapping, lexical, top_k, movies):
+    ids, coverage = lexical.search(user_text, top_k)
+    keep = coverage >= LEXICAL_MIN_COVERAGE
+    ids, coverage = ids[keep], coverage[keep]
+    if movies is not None and len(ids):
+        allowed = set(movies)
+        movie_ok = np.array([mapping[i]["movie"] in allowed for i in ids], dtype=bool)
+        ids, coverage = ids[movie_ok], coverage[movie_ok]
+    return ids, coverage * LEXICAL_FUSION_WEIGHT
+
+
+def _select_matches(user_text, distances, indices, mapping, dist_threshold):
+    user_text_clean = user_text.strip()
+    keep = (indices >= 0) & (distances <= dist_threshold)
 
-    for i, score in zip(indices[0], distances[0]):
+    results = []
+    for i, score, ok in zip(indices, distances, keep):
+        if not ok:
+            print(f"[❌ ФИЛТЪР] '{user_text_clean}' ❌ Причини: дистанция твърде голяма (score={score:.4f})")
+            continue
         try:
             scene = mapping[i]
             if not isinstance(scene, dict):
                 continue
-
             result = scene.copy()
             result["score"] = float(score)
+            print(f"[✅ ДОБАВЕНО] '{user_text_clean}' ✅ | score={score:.4f}")
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Грешка при mapping[{i}]: {e}")
+    return results
 
-            user_text_clean = user_text.strip()
-            words = user_text_clean.lower().split()
-            user_text_len = len(words)
-            unique_words = set(words)
 
-            # --- Филтри ---
-            reasons = []
-            if score > dist_threshold:
-                reasons.append(f"дистанция твърде голяма (score={score:.4f})")
-            if user_text_len < 5 or len(unique_words) < 4:
-                reasons.append("твърде кратък или малко уникални думи")
+def find_best_match(user_text, index, mapping, embedder, top_k=1, aggregate=False,
+                    movies=None, movie_indexes=None, lexical=None, catalog=None):
+    """
+    aggregate=False – поведението досега: сцените от top_k под прага, по дистанция.
+    aggregate=True – top_k кандидата с едно търсене, гласуване по филм и съседни
+    сцени; резултатът е подреден списък с movie, timestamp и confidence.
+    movies – име или списък с филми; търси се само в техните сцени
+    (с catalog – MovieCatalog – се приемат и заглавия).
+    lexical – LexicalIndex: дословните цитати се връщат без embedding, а в
+    aggregate режим BM25 попаденията се сливат с векторните.
+    """
+    if not user_text or not isinstance(user_text, str):
+        raise ValueError("❌ Входният текст за търсене е празен или невалиден.")
 
-            if reasons:
-                print(f"[❌ ФИЛТЪР] '{user_text_clean}' ❌ Причини: {', '.join(reasons)}")
-                continue
+    print("\n🔎 Започва проверка на резултатите чрез филтъра...\n")
 
-            print(
-                f"[✅ ДОБАВЕНО] '{user_text_clean}' ✅ | "
-                f"len={user_text_len}, unique={len(unique_words)}, score={score:.4f}"
-            )
-            results.append(result)
+    # Филтърът по дължина не зависи от резултатите – проверяваме го преди embedding-а
+    reasons = _text_filter_reasons(user_text)
+    if reasons:
+        print(f"[❌ ФИЛТЪР] '{user_text.strip()}' ❌ Причини: {', '.join(reasons)}")
+        print("⚠️ Няма адекватни резултати → No match found")
+        return []
 
-        except Exception as e:
-            print(f"❌ Грешка при mapping[{i}]: {e}")
+    movies = _normalize_movies(movies, catalog)
+
+    if lexical is not None:
+        exact = exact_quote_matches(user_text, mapping, lexical, movies)
+        if exact:
+            print(f"[⚡ ЛЕКСИКАЛНО] Дословен цитат – {len(exact)} резултата без embedding.")
+            return exact
+
+    vector = np.array([embedder.embed_text(user_text)]).astype("float32")
+    distances, indices = _search(index, mapping, vector, top_k, movies, movie_indexes)
+
+    dist_threshold = getattr(embedder, "match_threshold", 0.35)  # 🚫 Всичко над прага се отрязва
+
+    if aggregate:
+        lexical_hits = _lexical_votes(user_text, mapping, lexical, top_k, movies) if lexical is not None else None
+        results = rank_matches(distances[0], indices[0], mapping, dist_threshold, lexical_hits)
+    else:
+        results = _select_matches(user_text, distances[0], indices[0], mapping, dist_threshold)
 
     if not results:
         print("⚠️ Няма адекватни резултати → No match found")
@@ -89,59 +372,143 @@ def find_best_match(user_text, index, mapping, embedder, top_k=1):
     return results
 
 
-def get_scenes_up_to(timestamp, movie_name, mapping):
-    scenes = []
-    entries = mapping.values() if isinstance(mapping, dict) else mapping
+def find_best_matches(user_texts, index, mapping, embedder, top_k=1, aggregate=False,
+                      movies=None, movie_indexes=None, lexical=None, catalog=None):
+    """
+    Като find_best_match, но за списък от текстове: един batch embedding и едно
+    index.search върху цялата матрица. Връща списък от резултати за всеки текст.
+    """
+    results = [[] for _ in user_texts]
+    movies = _normalize_movies(movies, catalog)
+    valid = []
+    for pos, text in enumerate(user_texts):
+        if not text or not isinstance(text, str):
+            raise ValueError(f"❌ Текст #{pos + 1} за търсене е празен или невалиден.")
+        reasons = _text_filter_reasons(text)
+        if reasons:
+            print(f"[❌ ФИЛТЪР] '{text.strip()}' ❌ Причини: {', '.join(reasons)}")
+            continue
+        if lexical is not None:
+            # Дословните цитати не влизат в batch embedding-а
+            results[pos] = exact_quote_matches(text, mapping, lexical, movies)
+            if results[pos]:
+                continue
+        valid.append(pos)
+
+    if not valid:
+        return results
+
+    vectors = np.array(embedder.embed_texts([user_texts[pos] for pos in valid])).astype("float32")
+    distances, indices = _search(index, mapping, vectors, top_k, movies, movie_indexes)
+
+    dist_threshold = getattr(embedder, "match_threshold", 0.35)
+    for row, pos in enumerate(valid):
+        if aggregate:
+            lexical_hits = (
+                _lexical_votes(user_texts[pos], mapping, lexical, top_k, movies) if lexical is not None else None
+            )
+            results[pos] = rank_matches(distances[row], indices[row], mapping, dist_threshold, lexical_hits)
+        else:
+            results[pos] = _select_matches(user_texts[pos], distances[row], indices[row], mapping, dist_threshold)
+
+    print(f"🔎 Batch търсене: {len(user_texts)} текста, {sum(1 for r in results if r)} със съвпадение.")
+    return results
+
+
+class MovieTimeline:
+    """
+    Сцените на един филм, подредени по начално време (в милисекунди).
+    starts_ms[i] е началото на сцената с id scene_ids[i] в mapping-а.
+    """
+
+    __slots__ = ("starts_ms", "scene_ids")
+
+    def __init__(self, starts_ms, scene_ids):
+        self.starts_ms = starts_ms
+        self.scene_ids = scene_ids
+
+    def ids_up_to(self, time_ms):
+        return self.scene_ids[:bisect_right(self.starts_ms, time_ms)]
 
-    def time_to_float(t):
-        return float(t.replace(",", ".").replace(":", ""))
+    def last_scene_id(self):
+        return self.scene_ids[-1] if self.scene_ids else None
 
+
+def _store_timelines(store, movie_name=None):
+    # Колонният mapping вече държи movie_id и start_ms като numpy масиви
+    movie_ids = np.asarray(store.movie_ids)
+    start_ms = np.asarray(store.start_ms)
+    order = np.lexsort((store.scene_ids, start_ms, movie_ids))
+
+    timelines = {}
+    boundaries = np.flatnonzero(np.diff(movie_ids[order])) + 1
+    for rows in np.split(order, boundaries):
+        if len(rows) == 0:
+            continue
+        movie = store.movie_at(rows[0])
+        if movie_name is not None and movie != movie_name:
+            continue
+        timelines[movie] = MovieTimeline(start_ms[rows].tolist(), store.scene_ids[rows].tolist())
+    return timelines
+
+
+def build_movie_timelines(mapping, movie_name=None):
+    if isinstance(mapping, SceneStore):
+        return _store_timelines(mapping, movie_name)
+
+    per_movie = {}
+    items = mapping.items() if isinstance(mapping, dict) else enumerate(mapping)
+
+    for scene_id, entry in items:
+        if not isinstance(entry, dict):
+            continue
+        movie = entry.get("movie")
+        if movie is None or (movie_name is not None and movie != movie_name):
+            continue
+        try:
+            start_ms = timestamp_to_ms(entry["timestamp"])
+        except Exception as e:
+            print(f"[⚠️] Грешка при entry {scene_id}: {e}")
+            continue
+        per_movie.setdefault(movie, []).append((start_ms, scene_id))
+
+    timelines = {}
+    for movie, scenes in per_movie.items():
+        scenes.sort()
+        timelines[movie] = MovieTimeline(
+            [start for start, _ in scenes],
+            [scene_id for _, scene_id in scenes],
+        )
+    return timelines
+
+
+def _movie_timeline(movie_name, mapping, timelines):
+    if timelines is None:
+        # Без предварително построен timeline – еднократно обхождане само за този филм
+        timelines = build_movie_timelines(mapping, movie_name=movie_name)
+    return timelines.get(movie_name)
+
+
+def get_scenes_up_to(timestamp, movie_name, mapping, timelines=None):
     try:
-        current_time = time_to_float(timestamp)
+        current_ms = timestamp_to_ms(timestamp)
     except Exception as e:
         print(f"[ERROR] Неуспешно парсване на текущия timestamp: {timestamp} → {e}")
         return []
 
-    for entry in entries:
-        if isinstance(entry, dict) and entry.get("movie") == movie_name:
-            try:
-                entry_time = time_to_float(entry["timestamp"])
-                if entry_time <= current_time:
-                    scenes.append((entry_time, entry["lines"]))
-            except Exception as e:
-                print(f"[⚠️] Грешка при entry: {e}")
-
-    scenes.sort()
-    return [lines for _, lines in scenes]
-
-def get_movie_duration(movie_name, mapping):
-    latest_time_str = "00:00:00,000"
-    latest_time_float = 0.0
+    timeline = _movie_timeline(movie_name, mapping, timelines)
+    if timeline is None:
+        return []
 
-    def time_to_float(t):
-        try:
-            # Заменяме запетая с точка за универсалност
-            t = t.replace(",", ".")
+    return [mapping[scene_id]["lines"] for scene_id in timeline.ids_up_to(current_ms)]
 
-            # Разделяме на части: HH:MM:SS или HH:MM:SS.MS
-            h, m, s = t.split(":")
-            if "." in s:
-                s, ms = s.split(".")
-            else:
-                ms = "0"
 
-            return int(h) * 3600 + int(m) * 60 + int(s) + int(ms) / 1000.0
-        except Exception as e:
-            print(f"[⚠️] time_to_float() грешка при '{t}': {e}")
-            return 0.0
-
-    for entry in mapping.values():
-        if isinstance(entry, dict) and entry.get("movie") == movie_name:
-            timestamp = entry.get("timestamp")
-            if timestamp:
-                current_time_float = time_to_float(timestamp)
-                if current_time_float > latest_time_float:
-                    latest_time_float = current_time_float
-                    latest_time_str = timestamp
-
-    return latest_time_str
\ No newline at end of file
+def get_movie_duration(movie_name, mapping, timelines=None, catalog=None):
+    # С каталог – готова стойност от индексирането, без да се пипат сцените
+    if catalog is not None and movie_name in catalog:
+        return catalog.duration(movie_name)
+    timeline = _movie_timeline(movie_name, mapping, timelines)
+    last_id = timeline.last_scene_id() if timeline is not None else None
+    if last_id is None:
+        return "00:00:00,000"
+    return mapping[last_id]["timestamp"]
@@ -1,56 +1,161 @@
+import os
 import re
-import pysrt
+import codecs
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+
+from utils.segmentation import SUBTITLE_CUES_PER_SCENE, group_cues, segment, segmentation_config
+
+load_dotenv()
+
+# 🎞️ Един парсер за .srt файлове: чете файла ред по ред (генератор), разпознава
+# кодирането и CRLF, и връща времената като цели милисекунди.
+# Групирането на репликите в сцени е в utils/segmentation.py.
+SUBTITLE_FALLBACK_ENCODING = os.getenv("SUBTITLE_FALLBACK_ENCODING", "cp1252")
+SUBTITLE_PARSE_WORKERS = int(os.getenv("SUBTITLE_PARSE_WORKERS", "0"))  # 0 → брой ядра
+
+_SNIFF_BYTES = 64 * 1024
+_TIME_RE = re.compile(r"(\d+):(\d{1,2}):(\d{1,2})(?:[,.:](\d{1,3}))?")
+_TAG_RE = re.compile(r"<[^>]*>|\{\\[^}]*\}")
+
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def detect_encoding(file_path):
+    # BOM → съответното кодиране; иначе UTF-8, ако началото на файла е валиден UTF-8
+    with open(file_path, "rb") as f:
+        head = f.read(_SNIFF_BYTES)
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    try:
+        head.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        # Многобайтов символ, срязан от края на прочетеното, не е грешка
+        if e.start >= len(head) - 3 and len(head) == _SNIFF_BYTES:
+            return "utf-8"
+        return SUBTITLE_FALLBACK_ENCODING
+
+
+def _time_to_ms(value):
+    match = _TIME_RE.search(value)
+    if not match:
+        return None
+    h, m, s, frac = match.groups()
+    ms = int((frac + "00")[:3]) if frac else 0
+    return (int(h) * 3600 + int(m) * 60 + int(s)) * 1000 + ms
+
+
+def _parse_timing(line):
+    start, _, end = line.partition("-->")
+    start_ms = _time_to_ms(start)
+    end_ms = _time_to_ms(end)
+    if start_ms is None or end_ms is None:
+        return None
+    return start_ms, end_ms
+
+
+def _clean_text(lines):
+    text = " ".join(line.strip() for line in lines)
+    return " ".join(_TAG_RE.sub("", text).split())
+
+
+def iter_cues(file_path, encoding=None):
+    """
+    Генератор на репликите във файла: {"start_ms", "end_ms", "text"}.
+    Номерът на репликата не е задължителен, а празни/повредени блокове се пропускат.
+    Универсалните нови редове на Python покриват LF, CRLF и CR.
+    """
+    encoding = encoding or detect_encoding(file_path)
+    timing = None
+    text_lines = []
+
+    with open(file_path, "r", encoding=encoding, errors="replace") as f:
+        for raw_line in f:
+            line = raw_line.strip()
+            if "-->" in line:
+                parsed = _parse_timing(line)
+                if parsed is not None:
+                    # Нов блок без празен ред преди него – предишният приключва тук
+                    if timing is not None:
+                        cue = _make_cue(timing, text_lines)
+                        if cue:
+                            yield cue
+                    timing, text_lines = parsed, []
+                    continue
+            if not line:
+                if timing is not None:
+                    cue = _make_cue(timing, text_lines)
+                    if cue:
+                        yield cue
+                timing, text_lines = None, []
+                continue
+            if timing is not None:
+                text_lines.append(line)
+
+    if timing is not None:
+        cue = _make_cue(timing, text_lines)
+        if cue:
+            yield cue
+
+
+def _make_cue(timing, text_lines):
+    # Последният ред често е номерът на следващата реплика, когато липсва празен ред
+    if len(text_lines) > 1 and text_lines[-1].isdigit():
+        text_lines = text_lines[:-1]
+    text = _clean_text(text_lines)
+    if not text:
+        return None
+    return {"start_ms": timing[0], "end_ms": timing[1], "text": text}
+
+
+def parse_srt(file_path, max_lines_per_chunk=SUBTITLE_CUES_PER_SCENE):
+    return list(group_cues(iter_cues(file_path), max_lines_per_chunk))
 
-def parse_srt(file_path, max_lines_per_chunk=5):
-    subs = pysrt.open(file_path)
-    scenes = []
-    current_chunk = []
-    start_time = None
-
-    for i, sub in enumerate(subs):
-        if not start_time:
-            start_time = sub.start.to_time()
-
-        current_chunk.append(sub.text)
-
-
-        if len(current_chunk) >= max_lines_per_chunk or i == len(subs) - 1:
-            scenes.append({
-                "text": " ".join(current_chunk),
-                "timestamp": str(start_time)
-            })
-            current_chunk = []
-            start_time = None
-
-    return scenes
 
 def parse_srt_file(file_path):
-    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-        content = f.read()
-
-    blocks = content.strip().split('\n\n')
-    parsed = []
+    # По една сцена на реплика
+    return parse_srt(file_path, max_lines_per_chunk=1)
 
-    for block in blocks:
-        lines = block.strip().split('\n')
-        if len(lines) >= 3:
-            timestamp_line = lines[1]
-            text_lines = lines[2:]
 
+def parse_segments(file_path, config=None):
+    # Сцени според конфигурация от segmentation_config() (по подразбиране – от .env)
+    config = config or segmentation_config()
+    return list(segment(iter_cues(file_path), config["strategy"], **config["params"]))
 
-            start_time_raw = timestamp_line.split('-->')[0].strip()
-            start_time_clean = start_time_raw.split(',')[0]
 
+def _parse_one(args):
+    file_path, config = args
+    return parse_segments(file_path, config)
 
-            full_text = ' '.join(text_lines)
 
+def parse_files(file_paths, config=None, workers=SUBTITLE_PARSE_WORKERS):
+    """
+    Парсва много файлове паралелно в отделни процеси.
+    Връща {file_path: scenes} в реда на file_paths.
+    """
+    file_paths = list(file_paths)
+    config = config or segmentation_config()
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, len(file_paths))
+    if workers <= 1:
+        return {path: parse_segments(path, config) for path in file_paths}
 
-            clean_text = re.sub(r'<.*?>', '', full_text).strip()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(_parse_one, [(path, config) for path in file_paths], chunksize=4)
+        return dict(zip(file_paths, results))
 
-            if clean_text:
-                parsed.append({
-                    "text": clean_text,
-                    "timestamp": start_time_clean
-                })
 
-    return parsed
+def parse_directory(directory, config=None, workers=SUBTITLE_PARSE_WORKERS):
+    # Всички .srt файлове в папката → {име на файл: scenes}
+    filenames = sorted(name for name in os.listdir(directory) if name.endswith(".srt"))
+    parsed = parse_files([os.path.join(directory, name) for name in filenames], config, workers)
+    return {name: parsed[os.path.join(directory, name)] for name in filenames}
@@ -1,15 +1,32 @@
 
 import openai
 import os
+import threading
 import tiktoken  # ВАЖНО: да е най-отгоре с другите импорти
 from textwrap import dedent
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from utils.actor_lookup import get_actor_name
+from utils.summary_cache import summary_scope
 
 
 
 # Настройване на OpenAI API ключа
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
+# 🧵 Колко обобщения на чънкове вървят едновременно за една заявка
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "8"))
+CHUNK_ERROR_PLACEHOLDER = "⚠️ Неуспешно обобщение."
+
+# 🌳 Обобщение до момента: "tree" (map-reduce по нива) или "sequential" (сцена по сцена с растящ контекст)
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "tree")
+SUMMARY_LEAF_SCENES = int(os.getenv("SUMMARY_LEAF_SCENES", "4"))  # сцени в едно листо
+SUMMARY_FANOUT = int(os.getenv("SUMMARY_FANOUT", "4"))  # колко части се сливат в една на следващото ниво
+SUMMARY_FINAL_PARTS = int(os.getenv("SUMMARY_FINAL_PARTS", "8"))  # части (с "Scene X" раздели) във финалното обобщение
+SUMMARY_CHUNK_SCENES = 5  # сцени в един чънк на /summarize
+# 📚 Част от ключа в кеша на обобщенията – увеличава се при всяка промяна на промптите
+SUMMARY_PROMPT_VERSION = "1"
+
 LANGUAGE_MAP = {
     "en": "English",
     "bg": "Bulgarian",
@@ -22,11 +39,11 @@ LANGUAGE_MAP = {
 
 
 def summarize_scene(scene_text, movie_name=None, request_id=None, language="en"):
-    from app import cancelled_requests
+    from utils.cancellation import cancelled_requests
     language_name = LANGUAGE_MAP.get(language, "English")
     if request_id and request_id in cancelled_requests:
         cancelled_requests.discard(request_id)
-        raise Exception("Request was cancelled during summarize_scene")
+        raise CancelledEarlyException("Request was cancelled during summarize_scene")
 
     prompt = f"""
 You are a professional movie assistant. Your task is to write a short and coherent third-person summary of all the scenes up to this point in the movie. Focus on what has happened so far — key actions, settings, character interactions, and developments.
@@ -53,26 +70,77 @@ Scene:
 class CancelledEarlyException(Exception):
     pass
 
-def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
-    encoding = tiktoken.encoding_for_model(model)
-    return len(encoding.encode(text))
 
-def summarize_until_now(scenes, movie_name=None, max_tokens=15000, request_id=None, language="en"):
-    scene_summaries = []
-    context_so_far = ""
-    model = "gpt-3.5-turbo"
-    intro_tokens = count_tokens(f'Филмът "{movie_name or "Unknown"}" започва със сцената...\n\n', model=model)
-    language_name = LANGUAGE_MAP.get(language, "English")
+def _map_ordered(fn, items, workers=SUMMARY_WORKERS, on_error=None, label="Чънк"):
+    """
+    fn(i, item) за всеки елемент в най-много workers нишки; резултатите са в реда на items.
+    Грешка → on_error. Отмяната се вижда само от едно извикване (request_id се маха от
+    cancelled_requests), затова се споделя: чакащите не се пускат и накрая се вдига CancelledEarlyException.
+    """
+    if not items:
+        return []
+    cancelled = threading.Event()
+
+    def run(i, item):
+        if cancelled.is_set():
+            return None
+        try:
+            return fn(i, item)
+        except CancelledEarlyException:
+            print(f"[CANCEL] {label} {i + 1}: заявката е отменена")
+            cancelled.set()
+            return None
+        except Exception as e:
+            print(f"[ERROR] {label} {i + 1}: {e}")
+            return on_error
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(items)))) as pool:
+        results = list(pool.map(run, range(len(items)), items))
+
+    if cancelled.is_set():
+        raise CancelledEarlyException()
+    return results
+
+
+def summarize_chunks(scenes, movie_name=None, request_id=None, language="en", workers=SUMMARY_WORKERS,
+                     file_hash=None, chunk_scenes=SUMMARY_CHUNK_SCENES):
+    """
+    Сцените се групират по chunk_scenes и чънковете се обобщават паралелно (най-много workers
+    наведнъж); обобщенията са в реда на чънковете. Неуспешен чънк получава CHUNK_ERROR_PLACEHOLDER,
+    при отмяна – CancelledEarlyException. С file_hash обобщенията се взимат от/пишат в кеша.
+    """
+    chunks = [(start + 1, scenes[start:start + chunk_scenes]) for start in range(0, len(scenes), chunk_scenes)]
+    print(f"[DEBUG] Създадени {len(chunks)} чънка")
+    scope = summary_scope(movie_name, file_hash, language, "gpt-3.5-turbo", SUMMARY_PROMPT_VERSION)
+
+    def run(i, chunk):
+        first, group = chunk
+        compute = lambda: summarize_scene(
+            "\n".join(group), movie_name=movie_name, request_id=request_id, language=language
+        )
+        if scope is None:
+            chunk_summary = compute()
+        else:
+            chunk_summary = scope.get_or_compute("chunk", first, first + len(group) - 1, compute)
+        print(f"[CHUNK {i + 1}] Обобщение: {chunk_summary}")
+        return chunk_summary
+
+    return _map_ordered(run, chunks, workers, on_error=CHUNK_ERROR_PLACEHOLDER)
 
-    for i, scene in enumerate(scenes):
-        from app import cancelled_requests
-        # 🟢 Прекъсваме *преди* започване на scene[i]
-        if request_id and request_id in cancelled_requests:
-            print(f"[CANCEL] Прекъсване между сцена {i} и {i + 1} за заявка {request_id}")
-            cancelled_requests.discard(request_id)
-            raise CancelledEarlyException()
 
-        prompt = dedent(f"""
+@lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-3.5-turbo"):
+    # encoding_for_model зарежда BPE таблицата – веднъж на модел за целия процес
+    return tiktoken.encoding_for_model(model)
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    return len(get_encoding(model).encode(text))
+
+
+def build_scene_prompt(scene_number, movie_name, language_name, context_so_far, scene):
+    # Промптът за една сцена в последователния режим
+    return dedent(f"""
         You are a professional movie assistant helping summarize scenes for the film "{movie_name or 'Unknown'}".
         
         Your task is to produce the output entirely in {language_name}.  
@@ -87,7 +155,7 @@ def summarize_until_now(scenes, movie_name=None, max_tokens=15000, request_id=No
         - Translate and adapt naturally into {language_name} language while fully preserving the meaning, tone, cinematic detail, and clarity of the text.
         - The output must sound like it was originally written in {language_name} language, not like a translation.
 
-        This is Scene {i + 1}.
+        This is Scene {scene_number}.
 
         Instructions:
         - Mention the location briefly **only when it's new or relevant**. Do not repeat the same setting in every scene.
@@ -108,7 +176,51 @@ Do not add commentary or interpretation — just narrate the story as it unfolds
         \"\"\"
         """)
 
-        total_tokens_if_added = count_tokens(prompt, model=model) + count_tokens(context_so_far, model=model) + intro_tokens
+
+def summarize_until_now(scenes, movie_name=None, max_tokens=15000, request_id=None, language="en", mode=None,
+                        file_hash=None):
+    # file_hash (movie_catalog.summary_key: .srt файл + сегментация) включва кеша – без него всичко се смята наново
+    model = "gpt-3.5-turbo"
+    scope = summary_scope(movie_name, file_hash, language, model, SUMMARY_PROMPT_VERSION)
+    if (mode or SUMMARY_MODE) == "tree":
+        return summarize_tree(scenes, movie_name, max_tokens, request_id, language, scope=scope)
+
+    # 📚 Същото обобщение до тази сцена вече е правено
+    if scope is not None and scenes:
+        cached = scope.get("sequential", 1, len(scenes))
+        if cached is not None:
+            print(f"[SUMMARY CACHE] ✅ Готово обобщение на сцени 1–{len(scenes)}")
+            return cached
+
+    scene_summaries = []
+    context_so_far = ""
+    intro_tokens = count_tokens(f'Филмът "{movie_name or "Unknown"}" започва със сцената...\n\n', model=model)
+    language_name = LANGUAGE_MAP.get(language, "English")
+
+    # Най-дългият кеширан префикс от сцени – продължаваме след него със същия контекст
+    prefix = scope.scene_prefix("scene", len(scenes)) if scope is not None else []
+    for i, scene_summary in enumerate(prefix):
+        scene_summaries.append(f"———— Scene {i + 1} ————\n{scene_summary}")
+        context_so_far += "\n" + scene_summary
+    context_tokens = count_tokens(context_so_far, model=model) if context_so_far else 0
+    if prefix:
+        print(f"[SUMMARY CACHE] ♻️ Сцени 1–{len(prefix)} от кеша, обобщаваме {len(scenes) - len(prefix)} нови")
+
+    for i in range(len(prefix), len(scenes)):
+        scene = scenes[i]
+        from utils.cancellation import cancelled_requests
+        # 🟢 Прекъсваме *преди* започване на scene[i]
+        if request_id and request_id in cancelled_requests:
+            print(f"[CANCEL] Прекъсване между сцена {i} и {i + 1} за заявка {request_id}")
+            cancelled_requests.discard(request_id)
+            raise CancelledEarlyException()
+
+        prompt = build_scene_prompt(i + 1, movie_name, language_name, context_so_far, scene)
+
+        # 🧮 Контекстът е токенизиран веднъж (context_tokens се увеличава с всяко ново обобщение),
+        # затова за всяка сцена се броят само промптът без контекста и самата сцена
+        prompt_tokens = count_tokens(build_scene_prompt(i + 1, movie_name, language_name, "", scene), model=model)
+        total_tokens_if_added = prompt_tokens + 2 * context_tokens + intro_tokens
 
         if total_tokens_if_added > max_tokens:
             print(f"[LIMIT] Спираме обобщението на Scene {i + 1} – достигнат е лимит от {max_tokens} токена.")
@@ -133,6 +245,9 @@ Do not add commentary or interpretation — just narrate the story as it unfolds
             scene_summary = response.choices[0].message.content.strip()
             scene_summaries.append(f"———— Scene {i + 1} ————\n{scene_summary}")
             context_so_far += "\n" + scene_summary
+            context_tokens += count_tokens("\n" + scene_summary, model=model)
+            if scope is not None:
+                scope.put("scene", i + 1, i + 1, scene_summary)
 
         except Exception as e:
             print(f"[ERROR] Failed to summarize scene {i + 1}: {e}")
@@ -141,6 +256,15 @@ Do not add commentary or interpretation — just narrate the story as it unfolds
     if not scene_summaries:
         return "⚠️ Сцените са твърде дълги и не могат да бъдат обобщени в рамките на токен лимита."
 
+    summary = combine_scene_summaries(scene_summaries, movie_name, language, model, request_id)
+    if scope is not None:
+        scope.put("sequential", 1, len(scenes), summary)
+    return summary
+
+
+def combine_scene_summaries(scene_summaries, movie_name=None, language="en", model="gpt-3.5-turbo", request_id=None):
+    # Финалното обобщение от частите, всяка с раздел "———— Scene X ————"
+    language_name = LANGUAGE_MAP.get(language, "English")
     introduction = f'Филмът "{movie_name or "Unknown"}" започва със сцената...\n\n'
 
     final_prompt = dedent(f"""
@@ -162,7 +286,7 @@ Do not add commentary or interpretation — just narrate the story as it unfolds
     """)
 
     # 🛑 Проверка преди финалния call
-    from app import cancelled_requests
+    from utils.cancellation import cancelled_requests
     if request_id and request_id in cancelled_requests:
         print(f"[CANCEL] Финално обобщение прекратено преди отправяне на заявката за {request_id}")
         cancelled_requests.discard(request_id)
@@ -186,29 +310,185 @@ Do not add commentary or interpretation — just narrate the story as it unfolds
 
         return final_response.choices[0].message.content.strip()
 
+    except CancelledEarlyException:
+        raise
+
     except Exception as e:
         print(f"[ERROR] Failed to generate final summary: {e}")
         return "⚠️ Error summarizing scenes."
 
 
+def _ask(prompt, model, temperature, request_id, stage):
+    # Едно LLM извикване с проверка за отмяна преди и след него
+    from utils.cancellation import cancelled_requests
+    if request_id and request_id in cancelled_requests:
+        print(f"[CANCEL] {stage}: прекратено преди заявката за {request_id}")
+        cancelled_requests.discard(request_id)
+        raise CancelledEarlyException()
+
+    response = openai.ChatCompletion.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=temperature
+    )
+
+    if request_id and request_id in cancelled_requests:
+        print(f"[CANCEL] {stage}: прекратен response за {request_id}")
+        cancelled_requests.discard(request_id)
+        raise CancelledEarlyException()
+    return response.choices[0].message.content.strip()
+
+
+def _scene_label(first, last):
+    return f"Scene {first}" if first == last else f"Scenes {first}–{last}"
+
+
+def _summarize_leaf(scenes, first, movie_name, language_name, model, request_id):
+    last = first + len(scenes) - 1
+    numbered = "\n\n".join(f"Scene {first + offset}:\n{scene}" for offset, scene in enumerate(scenes))
+    prompt = dedent(f"""
+    You are a professional movie assistant helping summarize scenes for the film "{movie_name or 'Unknown'}".
+
+    Write the output entirely in {language_name}. Do not use any other language, even partially.
+    If the input is in another language, translate it fully into {language_name}.
+
+    These are {_scene_label(first, last)}, in order.
+
+    Instructions:
+    - Narrate what happens in these scenes, in order: key actions, decisions, arguments, character interactions.
+    - Mention the location briefly only when it's new or relevant.
+    - Use short character names and include real names, details and terms from the scenes.
+    - 3–6 sentences per scene. Clear. Cinematic. Detailed.
+    - Do not quote the dialogue and do not add commentary or interpretation.
+
+    Scenes:
+    \"\"\"
+    {numbered}
+    \"\"\"
+    """)
+    return _ask(prompt, model, 0.6, request_id, _scene_label(first, last))
+
+
+def _merge_parts(parts, movie_name, language_name, model, request_id):
+    first, last = parts[0]["first"], parts[-1]["last"]
+    sections = "\n\n".join(f"[{_scene_label(part['first'], part['last'])}]\n{part['text']}" for part in parts)
+    prompt = dedent(f"""
+    You are a professional movie assistant summarizing the film "{movie_name or 'Unknown'}".
+
+    Below are consecutive summaries of {_scene_label(first, last)}.
+    Merge them into one coherent narrative of these scenes, strictly in {language_name}.
+
+    Instructions:
+    - Keep every key event, decision and character development, in the original order.
+    - Keep real names, details and terms; drop repetition and repeated settings.
+    - Do not add commentary or interpretation — just narrate what happens.
+    - Be concise: at most 10 sentences.
+
+    Summaries:
+    {sections}
+    """)
+    return _ask(prompt, model, 0.6, request_id, _scene_label(first, last))
+
+
+def summarize_tree(scenes, movie_name=None, max_tokens=15000, request_id=None, language="en",
+                   model="gpt-3.5-turbo", leaf_scenes=SUMMARY_LEAF_SCENES, fanout=SUMMARY_FANOUT,
+                   final_parts=SUMMARY_FINAL_PARTS, workers=SUMMARY_WORKERS, scope=None):
+    """
+    🌳 Map-reduce обобщение: групи от leaf_scenes сцени се обобщават независимо и паралелно,
+    после съседни части се сливат по fanout на ниво, докато останат final_parts (и се събират
+    в max_tokens). Всяко извикване вижда ограничен текст – токените растат линейно с броя
+    на сцените, а латентността – логаритмично; късните сцени не се изрязват от лимита.
+    """
+    language_name = LANGUAGE_MAP.get(language, "English")
+    # 📚 Възлите на дървото зависят само от обхвата си (и от leaf_scenes/fanout), затова
+    # заявка за по-късен момент преизползва всички вече обобщени листа и сливания
+    shape = f"{leaf_scenes}x{fanout}"
+    final_kind = f"tree:{shape}x{final_parts}"
+    if scope is not None and scenes:
+        cached = scope.get(final_kind, 1, len(scenes))
+        if cached is not None:
+            print(f"[SUMMARY CACHE] ✅ Готово обобщение на сцени 1–{len(scenes)}")
+            return cached
+
+    def cached_node(kind, first, last, compute):
+        return compute() if scope is None else scope.get_or_compute(kind, first, last, compute)
+
+    leaves = [(start, scenes[start:start + leaf_scenes]) for start in range(0, len(scenes), leaf_scenes)]
+
+    summaries = _map_ordered(
+        lambda i, leaf: cached_node(
+            "leaf", leaf[0] + 1, leaf[0] + len(leaf[1]),
+            lambda: _summarize_leaf(leaf[1], leaf[0] + 1, movie_name, language_name, model, request_id),
+        ),
+        leaves, workers, label="Листо",
+    )
+    # Неуспешно листо се пропуска, както пропусната сцена в последователния режим
+    parts = [
+        {"first": start + 1, "last": start + len(group), "text": summary}
+        for (start, group), summary in zip(leaves, summaries) if summary
+    ]
+    if not parts:
+        return "⚠️ Сцените са твърде дълги и не могат да бъдат обобщени в рамките на токен лимита."
+
+    level = 0
+    while len(parts) > 1 and (
+        len(parts) > final_parts or count_tokens("\n".join(part["text"] for part in parts), model=model) > max_tokens
+    ):
+        level += 1
+        groups = [parts[i:i + max(2, fanout)] for i in range(0, len(parts), max(2, fanout))]
+        merged = _map_ordered(
+            lambda i, group: group[0]["text"] if len(group) == 1 else cached_node(
+                f"merge:{shape}:{level}", group[0]["first"], group[-1]["last"],
+                lambda: _merge_parts(group, movie_name, language_name, model, request_id),
+            ),
+            groups, workers, label=f"Ниво {level}, част",
+        )
+        # Неуспешно сливане – частите се слепват без LLM, за да не се губят сцени
+        parts = [
+            {"first": group[0]["first"], "last": group[-1]["last"],
+             "text": text or "\n".join(part["text"] for part in group)}
+            for group, text in zip(groups, merged)
+        ]
+        print(f"[TREE] Ниво {level}: {len(groups)} части")
+
+    scene_summaries = [f"———— Scene {part['first']} ————\n{part['text']}" for part in parts]
+    summary = combine_scene_summaries(scene_summaries, movie_name, language, model, request_id)
+    if scope is not None:
+        scope.put(final_kind, 1, len(scenes), summary)
+    return summary
+
+
 
 import openai
 import os
 import json
 import re
+import hashlib
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-def extract_character_profiles(summary_text: str, movie_name: str | None = None, max_characters: int = 10, request_id=None, language="en"):
+def extract_character_profiles(summary_text: str, movie_name: str | None = None, max_characters: int = 10, request_id=None, language="en",
+                               file_hash=None, scene_count=None):
     language_name = LANGUAGE_MAP.get(language, "English")
     if not summary_text or not isinstance(summary_text, str):
         return []
 
-    from app import cancelled_requests
+    from utils.cancellation import cancelled_requests
     if request_id and request_id in cancelled_requests:
         cancelled_requests.discard(request_id)
         raise Exception("Request was cancelled before extract_character_profiles")
 
+    # 📚 Профилите за точно това обобщение (на сцени 1..scene_count) – от кеша, ако ги има
+    scope = summary_scope(movie_name, file_hash, language, "gpt-3.5-turbo", SUMMARY_PROMPT_VERSION) if scene_count else None
+    profiles_kind = f"profiles:{max_characters}:{hashlib.sha256(summary_text.encode('utf-8')).hexdigest()[:16]}"
+    if scope is not None:
+        cached = scope.get(profiles_kind, 1, scene_count)
+        if cached is not None:
+            return json.loads(cached)
+
     scene_numbers = [int(n) for n in re.findall(r'—+\s*Scene\s+(\d+)\s*—+', summary_text)]
     scene_hint = f"Known scene numbers: {scene_numbers}" if scene_numbers else "No scene markers found."
 
@@ -294,6 +574,8 @@ SUMMARY:
 
             filtered.append(c)
 
+        if scope is not None and filtered:
+            scope.put(profiles_kind, 1, scene_count, json.dumps(filtered, ensure_ascii=False))
         return filtered
 
     except Exception as e:
@@ -0,0 +1,196 @@
+import os
+import time
+import sqlite3
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 📚 Постоянен кеш на LLM обобщенията (sqlite). Ключът е филм + hash на .srt файла и сегментацията
+# (movie_catalog.summary_key) + вид на обобщението + обхват от сцени (first..last, от 1) + език + модел
+# + версия на промптите. Нов hash изтрива старите обобщения на филма; над лимита се трият най-отдавна ползваните.
+# Записите от precompute_summaries.py са закачени (pinned) – лимитът не ги трие.
+SUMMARY_CACHE_PATH = os.getenv("SUMMARY_CACHE_PATH", "cache/summaries.sqlite")  # празно → изключен
+SUMMARY_CACHE_MAX_MB = float(os.getenv("SUMMARY_CACHE_MAX_MB", "200"))
+
+_TRIM_EVERY = 50
+
+
+class SummaryCache:
+    def __init__(self, path=SUMMARY_CACHE_PATH, max_mb=SUMMARY_CACHE_MAX_MB, pin=False):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.pin = pin  # всички записи от тази инстанция са закачени
+        self._lock = threading.Lock()
+        self._puts_since_trim = 0
+        self._checked = set()
+        # Една връзка за процеса; заявките и нишките на пула минават през self._lock
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            " movie TEXT NOT NULL, file_hash TEXT NOT NULL, kind TEXT NOT NULL,"
+            " first INTEGER NOT NULL, last INTEGER NOT NULL, language TEXT NOT NULL,"
+            " model TEXT NOT NULL, prompt_version TEXT NOT NULL, text TEXT NOT NULL,"
+            " size INTEGER NOT NULL, created REAL NOT NULL, used REAL NOT NULL,"
+            " pinned INTEGER NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (movie, file_hash, kind, first, last, language, model, prompt_version))"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(summaries)")}
+        if "pinned" not in columns:
+            self._db.execute("ALTER TABLE summaries ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0")
+        self._db.execute("CREATE INDEX IF NOT EXISTS summaries_used ON summaries (used)")
+        self._db.commit()
+
+    def get(self, movie, file_hash, kind, first, last, language, model, prompt_version):
+        key = (movie, file_hash, kind, first, last, language, model, prompt_version)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT text FROM summaries WHERE movie = ? AND file_hash = ? AND kind = ? AND first = ?"
+                " AND last = ? AND language = ? AND model = ? AND prompt_version = ?", key
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE summaries SET used = ? WHERE movie = ? AND file_hash = ? AND kind = ? AND first = ?"
+                " AND last = ? AND language = ? AND model = ? AND prompt_version = ?", (time.time(), *key)
+            )
+            self._db.commit()
+            return row[0]
+
+    def put(self, movie, file_hash, kind, first, last, language, model, prompt_version, text):
+        now = time.time()
+        with self._lock:
+            # Закачен запис остава закачен, дори да е презаписан от API-то
+            self._db.execute(
+                "INSERT OR REPLACE INTO summaries"
+                " (movie, file_hash, kind, first, last, language, model, prompt_version, text, size, created, used,"
+                " pinned)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, MAX(?, COALESCE((SELECT pinned FROM summaries"
+                " WHERE movie = ? AND file_hash = ? AND kind = ? AND first = ? AND last = ? AND language = ?"
+                " AND model = ? AND prompt_version = ?), 0)))",
+                (movie, file_hash, kind, first, last, language, model, prompt_version, text,
+                 len(text.encode("utf-8")), now, now, int(self.pin),
+                 movie, file_hash, kind, first, last, language, model, prompt_version),
+            )
+            self._db.commit()
+            self._puts_since_trim += 1
+            if self._puts_since_trim >= _TRIM_EVERY:
+                self._trim()
+
+    def scene_prefix(self, movie, file_hash, kind, last, language, model, prompt_version):
+        # Поредни обобщения на сцени 1, 2, ... (first == last) до първата липсваща, най-много до last
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT first, text FROM summaries WHERE movie = ? AND file_hash = ? AND kind = ?"
+                " AND first = last AND first <= ? AND language = ? AND model = ? AND prompt_version = ?"
+                " ORDER BY first",
+                (movie, file_hash, kind, last, language, model, prompt_version),
+            ).fetchall()
+        prefix = []
+        for first, text in rows:
+            if first != len(prefix) + 1:
+                break
+            prefix.append(text)
+        return prefix
+
+    def invalidate(self, movie, file_hash):
+        # Обобщенията от предишна версия на файла вече не важат – веднъж на процес за всеки hash
+        with self._lock:
+            if (movie, file_hash) in self._checked:
+                return 0
+            self._checked.add((movie, file_hash))
+            deleted = self._db.execute(
+                "DELETE FROM summaries WHERE movie = ? AND file_hash != ?", (movie, file_hash)
+            ).rowcount
+            self._db.commit()
+        if deleted:
+            print(f"[SUMMARY CACHE] 🧹 {movie}: изтрити {deleted} обобщения от стар файл.")
+        return deleted
+
+    def _trim(self):
+        # Най-отдавна ползваните записи се трият, докато общият размер влезе в лимита
+        self._puts_since_trim = 0
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        doomed = []
+        for rowid, size in self._db.execute("SELECT rowid, size FROM summaries WHERE pinned = 0 ORDER BY used"):
+            doomed.append((rowid,))
+            freed += size
+            if freed >= excess:
+                break
+        self._db.executemany("DELETE FROM summaries WHERE rowid = ?", doomed)
+        self._db.commit()
+        print(f"[SUMMARY CACHE] 🧹 Изтрити {len(doomed)} стари обобщения ({freed / 1024:.0f} KB).")
+
+    def stats(self):
+        with self._lock:
+            count, size, pinned = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(pinned), 0) FROM summaries"
+            ).fetchone()
+        return {"entries": count, "bytes": size, "pinned": pinned}
+
+
+class SummaryScope:
+    """
+    Кешът за едно обобщение: филм, файл, език, модел и версия на промптите са фиксирани,
+    остават видът и обхватът от сцени.
+    """
+
+    def __init__(self, cache, movie, file_hash, language, model, prompt_version):
+        self.cache = cache
+        self.key = (movie, file_hash)
+        self.params = (language, model, prompt_version)
+
+    def get(self, kind, first, last):
+        return self.cache.get(*self.key, kind, first, last, *self.params)
+
+    def put(self, kind, first, last, text):
+        # Съобщенията за грешка не се кешират – следващата заявка трябва да опита наново
+        if text and not text.startswith("⚠️"):
+            self.cache.put(*self.key, kind, first, last, *self.params, text)
+
+    def get_or_compute(self, kind, first, last, compute):
+        text = self.get(kind, first, last)
+        if text is None:
+            text = compute()
+            self.put(kind, first, last, text)
+        return text
+
+    def scene_prefix(self, kind, last):
+        return self.cache.scene_prefix(*self.key, kind, last, *self.params)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    # Един кеш за процеса; None, ако SUMMARY_CACHE_PATH е празно
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None and SUMMARY_CACHE_PATH:
+            _default_cache = SummaryCache()
+        return _default_cache
+
+
+def set_default_cache(cache):
+    # За скриптове със собствен кеш (напр. закачени записи в precompute_summaries.py)
+    global _default_cache
+    with _default_cache_lock:
+        _default_cache = cache
+
+
+def summary_scope(movie, file_hash, language, model, prompt_version, cache=None):
+    # Без hash на файла (напр. каталог без манифест) кешът не се ползва – не знаем кога е остарял
+    cache = cache if cache is not None else get_default_cache()
+    if cache is None or not movie or not file_hash:
+        return None
+    cache.invalidate(movie, file_hash)
+    return SummaryScope(cache, movie, file_hash, language, model, prompt_version)
@@ -0,0 +1,185 @@
+import os
+import sys
+import time
+import uuid
+import threading
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 🔄 /sync като фонова задача: заявката само поставя задача в опашката.
+# Изпълнява се най-много една задача наведнъж и най-много една чака след нея –
+# всички тригери, дошли междувременно, се сливат в чакащата задача.
+SYNC_JOB_HISTORY = int(os.getenv("SYNC_JOB_HISTORY", "50"))
+SYNC_OUTPUT_TAIL = int(os.getenv("SYNC_OUTPUT_TAIL", "4000"))  # символи от края на изхода на всеки етап
+SYNC_STAGE_TIMEOUT = int(os.getenv("SYNC_STAGE_TIMEOUT", "0"))  # секунди, 0 → без ограничение
+
+# Етапите се изпълняват на групи: групите една след друга, етапите в група – паралелно.
+# Firebase се синхронизира веднъж; индексът и описанията не зависят един от друг.
+DEFAULT_STAGES = [
+    [("firebase", ["firebase_utils.py"])],
+    [("subtitles", ["generate_index.py"]), ("descriptions", ["generate_description_embeddings.py"])],
+]
+# 🗂️ По желание – предварителни обобщения на филмите след новия индекс
+if os.getenv("SYNC_PRECOMPUTE_SUMMARIES", "0") == "1":
+    DEFAULT_STAGES.append([("summaries", ["precompute_summaries.py"])])
+
+
+def _now():
+    return time.time()
+
+
+class SyncJob:
+    def __init__(self, stages):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.triggers = 1
+        self.created = _now()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.stages = OrderedDict(
+            (name, {"status": "pending", "returncode": None, "seconds": None, "output": ""})
+            for group in stages for name, _ in group
+        )
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "triggers": self.triggers,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+            "stages": {name: dict(stage) for name, stage in self.stages.items()},
+        }
+
+
+class SyncJobRunner:
+    """
+    Пуска етапите като отделни процеси (python <скрипт>) в една фонова нишка.
+    on_stage_success(name) се вика след всеки успешен етап – напр. за презареждане на индекса.
+    """
+
+    def __init__(self, stages=DEFAULT_STAGES, on_stage_success=None, max_history=SYNC_JOB_HISTORY,
+                 output_tail=SYNC_OUTPUT_TAIL, stage_timeout=SYNC_STAGE_TIMEOUT):
+        self.stages = stages
+        self.on_stage_success = on_stage_success
+        self.max_history = max_history
+        self.output_tail = output_tail
+        self.stage_timeout = stage_timeout or None
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._running = None
+        self._queued = None
+        self._worker = None
+
+    def submit(self):
+        """
+        Връща (job, coalesced). Ако вече има чакаща задача, тригерът се добавя към нея;
+        ако текущата задача работи, се създава една чакаща след нея.
+        """
+        with self._lock:
+            if self._queued is not None:
+                self._queued.triggers += 1
+                return self._queued, True
+
+            job = SyncJob(self.stages)
+            self._jobs[job.id] = job
+            self._trim_history()
+            self._queued = job
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run_loop, name="sync-jobs", daemon=True)
+                self._worker.start()
+            return job, False
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job is not None else None
+
+    def _trim_history(self):
+        # Най-старите завършени задачи се забравят; текущата и чакащата остават
+        while len(self._jobs) > self.max_history:
+            for job_id, job in self._jobs.items():
+                if job.status not in ("queued", "running"):
+                    del self._jobs[job_id]
+                    break
+            else:
+                return
+
+    def _run_loop(self):
+        while True:
+            with self._lock:
+                job = self._queued
+                if job is None:
+                    self._worker = None
+                    return
+                self._queued = None
+                self._running = job
+                job.status = "running"
+                job.started = _now()
+
+            print(f"[SYNC] 🚀 Задача {job.id} стартира ({job.triggers} тригера).")
+            try:
+                self._run_job(job)
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+
+            with self._lock:
+                job.finished = _now()
+                self._running = None
+            print(f"[SYNC] 🏁 Задача {job.id}: {job.status} за {job.finished - job.started:.1f}s")
+
+    def _run_job(self, job):
+        for group in self.stages:
+            with ThreadPoolExecutor(max_workers=len(group)) as pool:
+                results = list(pool.map(lambda stage: self._run_stage(job, *stage), group))
+            failed = [name for (name, _), ok in zip(group, results) if not ok]
+            if failed:
+                job.status = "failed"
+                job.error = f"Неуспешни етапи: {', '.join(failed)}"
+                for name, stage in job.stages.items():
+                    if stage["status"] == "pending":
+                        stage["status"] = "skipped"
+                return
+        job.status = "succeeded"
+
+    def _run_stage(self, job, name, command):
+        stage = job.stages[name]
+        stage["status"] = "running"
+        started = _now()
+        # Firebase вече е синхронизиран от собствения си етап
+        env = dict(os.environ, SKIP_FIREBASE_SYNC="1")
+        try:
+            result = subprocess.run(
+                [sys.executable, *command], capture_output=True, text=True,
+                env=env, timeout=self.stage_timeout,
+            )
+            returncode, output = result.returncode, result.stdout + result.stderr
+        except subprocess.TimeoutExpired:
+            returncode, output = -1, f"⏱️ Изтече времето ({self.stage_timeout}s)"
+        except Exception as e:
+            returncode, output = -1, str(e)
+
+        stage["returncode"] = returncode
+        stage["seconds"] = round(_now() - started, 1)
+        stage["output"] = output[-self.output_tail:]
+        stage["status"] = "succeeded" if returncode == 0 else "failed"
+
+        if returncode != 0:
+            print(f"[SYNC] ❌ Етап {name} се провали (код {returncode}).")
+            return False
+        print(f"[SYNC] ✅ Етап {name} завърши за {stage['seconds']}s.")
+        if self.on_stage_success:
+            try:
+                self.on_stage_success(name)
+            except Exception as e:
+                print(f"[SYNC] ⚠️ on_stage_success({name}): {e}")
+        return True